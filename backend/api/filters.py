@@ -1,58 +1,145 @@
+from django.db.models import Count, Exists, OuterRef
+from django.db.models.functions import Length
+
 from django_filters import rest_framework as filters
-from recipes.models import Ingredient, Recipe
+from django_filters.widgets import QueryArrayWidget
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.search import search_recipes
+
+
+class SlugListWidget(QueryArrayWidget):
+    """Список из повторов параметра и значений через запятую.
+
+    ?tags=a&tags=b (так шлёт фронтенд) и ?tags=a,b дают одно и то же.
+    """
+
+    def value_from_datadict(self, data, files, name):
+        return [
+            slug
+            for value in super().value_from_datadict(data, files, name)
+            for slug in value.split(",")
+            if slug
+        ]
 
 
 class RecipeFilter(filters.FilterSet):
     """
     Фильтры для рецептов:
     - tags: список slug’ов тегов
+    - tags_mode: any (хотя бы один из тегов, по умолчанию) или all (все)
     - author: id автора
     - is_favorited / is_in_shopping_cart: булевы флаги
+    - search: полнотекстовый поиск с сортировкой по релевантности
+    - ordering: popular — по числу добавлений в избранное
+
+    Связи проверяются полусоединениями EXISTS, а не JOIN, поэтому строки
+    рецептов не размножаются и DISTINCT не нужен.
     """
 
-    tags = filters.BaseInFilter(field_name="tags__slug", lookup_expr="in")
+    TAGS_MODES = (("any", "any"), ("all", "all"))
+    ORDERINGS = (("newest", "newest"), ("popular", "popular"))
+
+    tags = filters.BaseInFilter(
+        method="filter_tags",
+        widget=SlugListWidget,
+    )
+    tags_mode = filters.ChoiceFilter(
+        choices=TAGS_MODES,
+        method="filter_tags_mode",
+    )
     author = filters.NumberFilter(field_name="author__id")
     is_favorited = filters.BooleanFilter(method="filter_favorited")
     is_in_shopping_cart = filters.BooleanFilter(
         method="filter_shopping_cart"
     )
+    search = filters.CharFilter(method="filter_search")
+    ordering = filters.ChoiceFilter(
+        choices=ORDERINGS,
+        method="filter_ordering",
+    )
 
     class Meta:
         model = Recipe
-        fields = ("tags", "author", "is_favorited", "is_in_shopping_cart")
-
-    def filter_favorited(self, queryset, name, value):
-        user = getattr(self.request, "user", None)
-        if user is None or user.is_anonymous:
-            return queryset.none() if value else queryset
+        fields = (
+            "tags",
+            "tags_mode",
+            "author",
+            "is_favorited",
+            "is_in_shopping_cart",
+            "search",
+            "ordering",
+        )
 
-        lookup = {"favorite__user": user}
-        qs = (
-            queryset.filter(**lookup)
-            if value
-            else queryset.exclude(**lookup)
+    def filter_tags(self, queryset, name, value):
+        # Порядок фиксирован, чтобы SQL запроса не менялся от запуска к
+        # запуску.
+        slugs = sorted(set(value))
+        if not slugs:
+            return queryset
+        # Теги — подзапросом по slug, а не JOIN с таблицей тегов.
+        links = Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef("pk"),
+            tag_id__in=Tag.objects.filter(slug__in=slugs).values("pk"),
         )
-        return qs.distinct()
+        if self.form.cleaned_data.get("tags_mode") == "all":
+            # Рецепт подходит, если среди его связей нашлись все теги:
+            # одна группировка по рецепту вместо JOIN на каждый тег.
+            links = (
+                links.order_by()
+                .values("recipe_id")
+                .annotate(matched=Count("tag_id"))
+                .filter(matched=len(slugs))
+            )
+        return queryset.filter(Exists(links))
 
-    def filter_shopping_cart(self, queryset, name, value):
+    def filter_tags_mode(self, queryset, name, value):
+        # Учитывается в filter_tags.
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        value = value.strip()
+        return search_recipes(queryset, value) if value else queryset
+
+    def filter_ordering(self, queryset, name, value):
+        # Порядок совпадает с индексом recipe_popular_idx. Курсорная
+        # пагинация всегда идёт по дате и этот параметр не учитывает.
+        if value == "popular":
+            return queryset.order_by("-favorites_count", "-created", "-id")
+        return queryset.order_by("-created", "-id")
+
+    def _filter_relation(self, queryset, model, value):
         user = getattr(self.request, "user", None)
         if user is None or user.is_anonymous:
             return queryset.none() if value else queryset
 
-        lookup = {"shoppingcart__user": user}
-        qs = (
-            queryset.filter(**lookup)
-            if value
-            else queryset.exclude(**lookup)
+        related = Exists(
+            model.objects.filter(user=user, recipe=OuterRef("pk")),
         )
-        return qs.distinct()
+        return queryset.filter(related if value else ~related)
+
+    def filter_favorited(self, queryset, name, value):
+        return self._filter_relation(queryset, Favorite, value)
+
+    def filter_shopping_cart(self, queryset, name, value):
+        return self._filter_relation(queryset, ShoppingCart, value)
 
 
 class IngredientFilter(filters.FilterSet):
-    """Поиск ингредиента по названию, beginnt mit… (istartswith)."""
+    """Поиск ингредиента по названию, beginnt mit… (istartswith).
 
-    name = filters.CharFilter(field_name="name", lookup_expr="istartswith")
+    Используется, когда поиск в памяти (recipes.search) отключён; запрос
+    покрывается индексом ingredient_name_upper_like_idx. Порядок тот же:
+    сначала более короткие имена, затем по алфавиту.
+    """
+
+    name = filters.CharFilter(method="filter_name")
 
     class Meta:
         model = Ingredient
         fields = ("name",)
+
+    def filter_name(self, queryset, name, value):
+        return queryset.filter(name__istartswith=value).order_by(
+            Length("name"),
+            "name",
+        )
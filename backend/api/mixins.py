@@ -0,0 +1,78 @@
+from calendar import timegm
+import hashlib
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    raw = ":".join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def table_etag(model):
+    """ETag всей таблицы: число строк и самая поздняя отметка updated.
+
+    Добавление и изменение сдвигают максимум updated, удаление — счётчик,
+    так что значение меняется при любой правке справочника.
+    """
+    stats = model.objects.aggregate(count=Count("pk"), last=Max("updated"))
+    return make_etag(model._meta.label, stats["count"], stats["last"])
+
+
+class ConditionalGetMixin:
+    """Условные GET (ETag / Last-Modified) для list и retrieve.
+
+    Наследники отдают валидаторы из get_list_validators и
+    get_object_validators — дешёвые значения, которые считаются без
+    сериализации. При совпадении If-None-Match / If-Modified-Since
+    ответ 304 возвращается до вызова сериализатора.
+    """
+
+    # Заголовки запроса, от которых зависит тело ответа.
+    conditional_vary = ()
+
+    def get_list_validators(self):
+        return None, None
+
+    def get_object_validators(self):
+        return None, None
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(
+            self.get_list_validators(),
+            super().list,
+            request,
+            *args,
+            **kwargs,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(
+            self.get_object_validators(),
+            super().retrieve,
+            request,
+            *args,
+            **kwargs,
+        )
+
+    def _conditional(self, validators, handler, request, *args, **kwargs):
+        etag, last_modified = validators
+        timestamp = (
+            timegm(last_modified.utctimetuple()) if last_modified else None
+        )
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=timestamp,
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if 200 <= response.status_code < 300:
+                if etag:
+                    response["ETag"] = etag
+                if timestamp is not None:
+                    response["Last-Modified"] = http_date(timestamp)
+        if self.conditional_vary:
+            patch_vary_headers(response, self.conditional_vary)
+        return response
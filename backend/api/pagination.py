@@ -0,0 +1,91 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import (
+    remove_query_param,
+    replace_query_param,
+)
+
+
+class RecipeKeysetPagination(BasePagination):
+    """Курсорная (keyset) пагинация ленты рецептов по (-created, -id).
+
+    Вместо COUNT(*) и OFFSET страница выбирается условием «строго после
+    последнего увиденного рецепта», которое покрывается индексом
+    recipe_created_id_idx, поэтому глубокие страницы стоят столько же,
+    сколько первая. Включается параметром ``?pagination=cursor``
+    (или наличием ``cursor``), размер страницы задаётся ``limit``.
+    """
+
+    ordering = ("-created", "-id")
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = "limit"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Неверный курсор"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            created, pk = position
+            queryset = queryset.filter(created__lte=created).exclude(
+                created=created,
+                id__gte=pk,
+            )
+        page = list(queryset[: self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        page = page[: self.page_size]
+        self.next_position = (
+            (page[-1].created, page[-1].pk) if self.has_next else None
+        )
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size,
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, "page")
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position),
+        )
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            created, pk = (
+                urlsafe_b64decode(encoded.encode("ascii"))
+                .decode("ascii")
+                .split("|")
+            )
+            return datetime.fromisoformat(created), int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message) from None
+
+    def encode_cursor(self, position):
+        created, pk = position
+        raw = f"{created.isoformat()}|{pk}"
+        return urlsafe_b64encode(raw.encode("ascii")).decode("ascii")
@@ -0,0 +1,65 @@
+import uuid
+from django.conf import settings
+from django.core.files.uploadhandler import (
+    FileUploadHandler,
+    TemporaryFileUploadHandler,
+)
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import FileUploadParser
+from recipes.images import TemporaryImageFile
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "Загружаемый файл слишком большой."
+    default_code = "too_large"
+
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загружаемые файлы сразу на диск и обрывает слишком большие.
+
+    В памяти держится только текущий кусок (chunk_size), поэтому пиковое
+    потребление на загрузку не зависит от размера файла. Лимит —
+    IMAGE_UPLOAD_MAX_BYTES.
+    """
+
+    def new_file(self, *args, **kwargs):
+        FileUploadHandler.new_file(self, *args, **kwargs)
+        self.file = TemporaryImageFile(
+            self.file_name,
+            self.content_type,
+            0,
+            self.charset,
+            self.content_type_extra,
+        )
+
+    def receive_data_chunk(self, raw_data, start):
+        limit = settings.IMAGE_UPLOAD_MAX_BYTES
+        if start + len(raw_data) > limit:
+            self.file.close()
+            raise UploadTooLarge(f"Размер файла превышает {limit} байт.")
+        return super().receive_data_chunk(raw_data, start)
+
+
+class RawImageParser(FileUploadParser):
+    """Тело запроса — сам файл изображения (Content-Type: image/*).
+
+    Файл потоково пишется на диск обработчиками загрузки и попадает в
+    request.data["file"]. Content-Disposition не обязателен: имя
+    генерируется по типу содержимого.
+    """
+
+    media_type = "image/*"
+
+    def get_filename(self, stream, media_type, parser_context):
+        ext = media_type.split(";")[0].split("/")[-1].strip()
+        return f"{uuid.uuid4().hex[:10]}.{ext}"
+
+
+def image_payload(request, field):
+    """Данные запроса, где сырой файл (image/*) лежит под именем ``field``."""
+    if request.content_type.startswith("image/"):
+        return {field: request.data.get("file")}
+    return request.data
@@ -1,14 +1,22 @@
-import base64
+import binascii
+from collections import Counter
+import json
 import uuid
-from django.core.files.base import ContentFile
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import Manager, prefetch_related_objects
+from django.http import Http404
 
 from djoser.serializers import (
     UserCreateSerializer as BaseUserCreateSerializer,
 )
 from djoser.serializers import UserSerializer as BaseUserSerializer
 from rest_framework import serializers
+from rest_framework.settings import api_settings
+from rest_framework.utils import html
 import six
+from recipes import relations
+from recipes.cache import get_representations
+from recipes.images import ImageTooLarge, decode_base64_image, variant_urls
 from recipes.models import (
     Favorite,
     Ingredient,
@@ -17,20 +25,135 @@ from recipes.models import (
     ShoppingCart,
     Tag,
 )
+from recipes.signals import defer_link_deltas, notify_ingredients_changed
 from users.models import Subscription, User
+from users.subscriptions import subscribe
+
+RECIPES_PREVIEW_LIMIT = 3
+
+
+def get_recipes_limit(request):
+    """Значение ``recipes_limit`` из запроса (по умолчанию — 3)."""
+    try:
+        limit = int(request.query_params["recipes_limit"])
+    except (KeyError, TypeError, ValueError):
+        return RECIPES_PREVIEW_LIMIT
+    return max(limit, 0)
+
+
+def subscribed_author_ids(request):
+    """Id авторов, на которых подписан текущий пользователь.
+
+    Загружаются одним запросом и запоминаются на объекте запроса, чтобы
+    все вложенные UserSerializer одного ответа пользовались общим набором.
+    """
+    ids = getattr(request, "_subscribed_author_ids", None)
+    if ids is None:
+        ids = set(
+            Subscription.objects.filter(user=request.user).values_list(
+                "following_id",
+                flat=True,
+            ),
+        )
+        request._subscribed_author_ids = ids
+    return ids
+
+
+def parse_form_data(data, list_fields):
+    """Приводит данные multipart/form-data к виду, как из JSON.
+
+    Поля из ``list_fields`` принимаются строкой JSON
+    (``ingredients=[{"id": 1, "amount": 2}]``) или повторяющимся ключом
+    (``tags=1&tags=2``); у остальных берётся последнее значение.
+    """
+    result = {}
+    for key, values in data.lists():
+        if key not in list_fields:
+            result[key] = values[-1]
+        elif len(values) == 1 and values[0].lstrip().startswith("["):
+            try:
+                result[key] = json.loads(values[0])
+            except ValueError:
+                raise serializers.ValidationError(
+                    {key: ["Некорректный JSON."]},
+                ) from None
+        else:
+            result[key] = values
+    return result
+
+
+def resolve_pks(queryset, pks):
+    """Объекты из ``queryset`` по списку id — одним запросом id__in.
+
+    Повторы и несуществующие id попадают в одну ошибку валидации — оба
+    списка сразу, а не по одному за запрос. Порядок результата совпадает
+    с ``pks``.
+    """
+    duplicates = sorted(
+        pk for pk, count in Counter(pks).items() if count > 1
+    )
+    objects = queryset.in_bulk(pks)
+    missing = [pk for pk in dict.fromkeys(pks) if pk not in objects]
+    errors = []
+    if duplicates:
+        errors.append(
+            f"Повторяющиеся id: {', '.join(map(str, duplicates))}",
+        )
+    if missing:
+        errors.append(
+            f"Не найдены объекты с id: {', '.join(map(str, missing))}",
+        )
+    if errors:
+        raise serializers.ValidationError(errors)
+    return [objects[pk] for pk in pks]
+
+
+class BulkPrimaryKeyRelatedField(serializers.ListField):
+    """Список id, разрешаемый в объекты одним запросом (см. resolve_pks).
+
+    Замена PrimaryKeyRelatedField(many=True), который ищет каждый id
+    отдельным запросом.
+    """
+
+    child = serializers.IntegerField(min_value=1)
+
+    def __init__(self, queryset, **kwargs):
+        self.queryset = queryset
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        return resolve_pks(self.queryset, super().to_internal_value(data))
+
+    def to_representation(self, value):
+        return [obj.pk for obj in value]
 
 
 class Base64ImageField(serializers.ImageField):
-    """Принимает изображение в формате base64 и сохраняет как ImageField."""
+    """Принимает изображение в формате base64 и сохраняет как ImageField.
+
+    Данные декодируются потоково во временный файл с ограничением размера
+    IMAGE_UPLOAD_MAX_BYTES (recipes.images.decode_base64_image).
+    """
+
+    default_error_messages = {
+        "too_large": "Размер изображения превышает {limit} байт.",
+        "invalid_base64": "Некорректные данные base64.",
+    }
 
     def to_internal_value(self, data):
         if isinstance(data, six.string_types) and data.startswith(
             "data:image",
         ):
-            header, imgstr = data.split(";base64,")
-            ext = header.split("/")[-1]
+            header, _, encoded = data.partition(";base64,")
+            content_type = header[len("data:") :]
+            ext = content_type.split("/")[-1]
             name = f"{uuid.uuid4().hex[:10]}.{ext}"
-            data = ContentFile(base64.b64decode(imgstr), name=name)
+            try:
+                data = decode_base64_image(encoded, name, content_type)
+            except ImageTooLarge as error:
+                self.fail("too_large", limit=error.args[0])
+            except (binascii.Error, UnicodeEncodeError):
+                self.fail("invalid_base64")
         return super().to_internal_value(data)
 
 
@@ -59,17 +182,51 @@ class IngredientInRecipeReadSerializer(serializers.ModelSerializer):
 
 
 class IngredientAmountWriteSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        source="ingredient",
-        queryset=Ingredient.objects.all(),
-    )
+    # Объекты Ingredient подставляет RecipeWriteSerializer сразу для всего
+    # списка (validate_ingredients).
+    id = serializers.IntegerField(source="ingredient", min_value=1)
 
     class Meta:
         model = IngredientInRecipe
         fields = ("id", "amount")
 
 
+class RecipeShortSerializer(serializers.ModelSerializer):
+    """Краткое представление рецепта для превью в подписках."""
+
+    image = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Recipe
+        fields = ("id", "name", "image", "cooking_time")
+
+    def get_image(self, obj):
+        # Превью — маленький вариант (оригинал, пока он не готов).
+        request = self.context.get("request")
+        thumb = variant_urls(obj).get("thumb")
+        return (
+            request.build_absolute_uri(thumb) if thumb and request else None
+        )
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    # В списках поле image ссылается на вариант для карточки.
+    image_variant = "card"
+
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        return self.child.represent_many(recipes, self.image_variant)
+
+
 class RecipeReadSerializer(serializers.ModelSerializer):
+    """Полное представление рецепта.
+
+    Не зависящая от зрителя часть (теги, ингредиенты, автор, относительные
+    ссылки на файлы) берётся из кэша recipes.cache; поверх неё досчитываются
+    абсолютные ссылки и флаги текущего пользователя. Без request в контексте
+    сериализатор как раз и отрисовывает эту общую часть.
+    """
+
     tags = TagSerializer(many=True, read_only=True)
     author = serializers.SerializerMethodField()
     ingredients = IngredientInRecipeReadSerializer(
@@ -78,6 +235,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         read_only=True,
     )
     image = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -90,46 +248,105 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             "ingredients",
             "name",
             "image",
+            "image_variants",
             "text",
             "cooking_time",
             "is_favorited",
             "is_in_shopping_cart",
         )
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        if "request" not in self.context:
+            return super().to_representation(instance)
+        return self.represent_many([instance])[0]
+
+    def represent_many(self, recipes, image_variant=None):
+        shared = get_representations(recipes, self._render_shared)
+        return [
+            self._personalize(recipe, shared[recipe.pk], image_variant)
+            for recipe in recipes
+        ]
+
+    @staticmethod
+    def _render_shared(recipes):
+        prefetch_related_objects(
+            recipes,
+            "tags",
+            "ingredient_links__ingredient",
+        )
+        return {
+            recipe.pk: RecipeReadSerializer(recipe).data
+            for recipe in recipes
+        }
+
+    def _personalize(self, recipe, shared, image_variant=None):
+        request = self.context["request"]
+        data = dict(shared)
+        author = dict(data["author"])
+        variants = {
+            variant: request.build_absolute_uri(url)
+            for variant, url in data["image_variants"].items()
+        }
+        data["image_variants"] = variants
+        if image_variant in variants:
+            data["image"] = variants[image_variant]
+        elif data["image"]:
+            data["image"] = request.build_absolute_uri(data["image"])
+        if author["avatar"]:
+            author["avatar"] = request.build_absolute_uri(author["avatar"])
+        if not request.user.is_anonymous:
+            # Как и флаги, подписка могла прийти аннотацией вместе с рецептом.
+            subscribed = getattr(recipe, "author_subscribed", None)
+            if subscribed is None:
+                subscribed = author["id"] in subscribed_author_ids(request)
+            author["is_subscribed"] = subscribed
+        data["author"] = author
+        data["is_favorited"] = self.get_is_favorited(recipe)
+        data["is_in_shopping_cart"] = self.get_is_in_shopping_cart(recipe)
+        return data
 
     def get_author(self, obj):
         return UserSerializer(obj.author, context=self.context).data
 
     def get_image(self, obj):
+        if not obj.image:
+            return None
         request = self.context.get("request")
         return (
             request.build_absolute_uri(obj.image.url)
-            if obj.image and request
-            else None
+            if request
+            else obj.image.url
         )
 
+    def get_image_variants(self, obj):
+        request = self.context.get("request")
+        return {
+            variant: request.build_absolute_uri(url) if request else url
+            for variant, url in variant_urls(obj).items()
+        }
+
+    def _user_flag(self, obj, attr, relation):
+        # Флаг обычно уже посчитан аннотацией RecipeQuerySet.with_user_flags;
+        # запрос делаем только для объектов, загруженных в обход неё.
+        flag = getattr(obj, attr, None)
+        if flag is not None:
+            return flag
+        request = self.context.get("request")
+        if request is None or request.user.is_anonymous:
+            return False
+        return getattr(obj, relation).filter(user=request.user).exists()
+
     def get_is_favorited(self, obj):
-        user = self.context.get("request").user
-        return (
-            False
-            if user.is_anonymous
-            else obj.favorite.filter(user=user).exists()
-        )
+        return self._user_flag(obj, "is_favorited", "favorite")
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get("request").user
-        return (
-            False
-            if user.is_anonymous
-            else obj.shoppingcart.filter(user=user).exists()
-        )
+        return self._user_flag(obj, "is_in_shopping_cart", "shoppingcart")
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
     ingredients = IngredientAmountWriteSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all(),
-    )
+    tags = BulkPrimaryKeyRelatedField(queryset=Tag.objects.all())
     image = Base64ImageField()
     cooking_time = serializers.IntegerField(min_value=1)
 
@@ -144,20 +361,81 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             "cooking_time",
         )
 
-    def _save_tags_and_ingredients(self, recipe, tags, ingredients):
-        recipe.tags.set(tags)
-        recipe.ingredient_links.all().delete()
-        IngredientInRecipe.objects.bulk_create(
-            [
-                IngredientInRecipe(
-                    recipe=recipe,
-                    ingredient=item["ingredient"],
-                    amount=item["amount"],
-                )
-                for item in ingredients
-            ],
+    def validate_ingredients(self, value):
+        ingredients = resolve_pks(
+            Ingredient.objects.all(),
+            [item["ingredient"] for item in value],
         )
-
+        for item, ingredient in zip(value, ingredients):
+            item["ingredient"] = ingredient
+        return value
+
+    def _save_ingredients(self, recipe, ingredients, created=False):
+        """Приводит ингредиенты рецепта к списку ``ingredients``.
+
+        Вместо удаления и повторной вставки всех связей считается разница
+        с текущими: вставки, изменения количества и удаления выполняются
+        только при необходимости, каждая операция — одним запросом. Та же
+        разница по ингредиентам сдвигает списки покупок; если связи не
+        менялись, списки не трогаются.
+        """
+        wanted = {
+            item["ingredient"].pk: item["amount"] for item in ingredients
+        }
+        current = (
+            {}
+            if created
+            else {
+                link.ingredient_id: link
+                for link in recipe.ingredient_links.all()
+            }
+        )
+        stale = [
+            link.pk
+            for ingredient_id, link in current.items()
+            if ingredient_id not in wanted
+        ]
+        changed = []
+        deltas = Counter()
+        for ingredient_id, link in current.items():
+            amount = wanted.get(ingredient_id, 0)
+            if amount != link.amount:
+                deltas[ingredient_id] = amount - link.amount
+            if amount and amount != link.amount:
+                link.amount = amount
+                changed.append(link)
+        added = [
+            IngredientInRecipe(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=amount,
+            )
+            for ingredient_id, amount in wanted.items()
+            if ingredient_id not in current
+        ]
+        if stale:
+            # Разница для списков покупок уже посчитана: post_delete по
+            # каждой связи её не применяет.
+            defer_link_deltas(recipe.pk)
+            IngredientInRecipe.objects.filter(pk__in=stale).delete()
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ["amount"])
+        if added:
+            IngredientInRecipe.objects.bulk_create(added)
+            if not created:
+                deltas.update(
+                    {link.ingredient_id: link.amount for link in added}
+                )
+        if stale or changed or added:
+            # bulk_update и bulk_create не отправляют post_save. Новый
+            # рецепт ещё ни в чьей корзине — разница не нужна.
+            notify_ingredients_changed(
+                recipe.pk,
+                deltas,
+                reindex=bool(stale or added),
+            )
+
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop("tags")
         ingredients = validated_data.pop("ingredients")
@@ -165,26 +443,39 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             author=self.context["request"].user,
             **validated_data,
         )
-        self._save_tags_and_ingredients(recipe, tags, ingredients)
+        recipe.tags.set(tags)
+        self._save_ingredients(recipe, ingredients, created=True)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop("tags", None)
         ingredients = validated_data.pop("ingredients", None)
         instance = super().update(instance, validated_data)
-        self._save_tags_and_ingredients(
-            instance,
-            tags or instance.tags.all(),
-            ingredients or [],
-        )
+        # tags.set сам считает разницу с текущими тегами.
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None:
+            self._save_ingredients(instance, ingredients)
         return instance
 
 
 class RecipeSerializer(serializers.Serializer):
+    class Meta:
+        list_serializer_class = RecipeListSerializer
+
     def to_representation(self, instance):
         return RecipeReadSerializer(instance, context=self.context).data
 
+    def represent_many(self, recipes, image_variant=None):
+        return RecipeReadSerializer(context=self.context).represent_many(
+            recipes,
+            image_variant,
+        )
+
     def to_internal_value(self, data):
+        if html.is_html_input(data):
+            data = parse_form_data(data, ("tags", "ingredients"))
         return RecipeWriteSerializer(
             data=data,
             context=self.context,
@@ -203,22 +494,32 @@ class RecipeSerializer(serializers.Serializer):
 
 
 class _RelationBaseSerializer(serializers.ModelSerializer):
+    """Добавление рецепта (id) в избранное или корзину.
+
+    save() пишет связь одним запросом (recipes.relations.add_one) и
+    возвращает рецепт с флагами зрителя, готовый для ответа.
+    """
+
     id = serializers.IntegerField(write_only=True)
 
     class Meta:
         fields = ("id",)
         extra_kwargs = {"id": {"write_only": True}}
 
-    def validate(self, attrs):
-        recipe_id = attrs["id"]
-        recipe = get_object_or_404(Recipe, pk=recipe_id)
-        attrs["recipe"] = recipe
-        user = self.context["request"].user
-        attrs["user"] = user
-        model = self.Meta.model
-        if model.objects.filter(user=user, recipe=recipe).exists():
-            raise serializers.ValidationError("Уже добавлено")
-        return attrs
+    def create(self, validated_data):
+        # id — это id рецепта, а не первичный ключ создаваемой связи.
+        recipe, created = relations.add_one(
+            self.Meta.model,
+            self.context["request"].user,
+            validated_data["id"],
+        )
+        if recipe is None:
+            raise Http404
+        if not created:
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: ["Уже добавлено"]},
+            )
+        return recipe
 
 
 class FavoriteCreateSerializer(_RelationBaseSerializer):
@@ -231,6 +532,20 @@ class ShoppingCartCreateSerializer(_RelationBaseSerializer):
         model = ShoppingCart
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    """Тело массовых операций с избранным и корзиной: {"ids": [...]}."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100,
+    )
+
+    def validate_ids(self, value):
+        # Повторы не ошибка: результат по каждому id один.
+        return list(dict.fromkeys(value))
+
+
 class UserCreateSerializer(BaseUserCreateSerializer):
     avatar = Base64ImageField(max_length=None, use_url=True, required=False)
 
@@ -252,40 +567,50 @@ class UserSerializer(BaseUserSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        flag = getattr(obj, "is_subscribed", None)
+        if flag is not None:
+            return flag
         request = self.context.get("request")
-        return (
-            False
-            if not request or request.user.is_anonymous
-            else Subscription.objects.filter(
-                user=request.user,
-                following=obj,
-            ).exists()
-        )
+        if not request or request.user.is_anonymous:
+            return False
+        return obj.pk in subscribed_author_ids(request)
 
 
 class SubscriptionCreateSerializer(serializers.ModelSerializer):
-    following = serializers.PrimaryKeyRelatedField(
-        queryset=User.objects.all(),
-        write_only=True,
-    )
+    """Подписка на автора; save() — один запрос (users.subscriptions)."""
+
+    following = serializers.IntegerField(write_only=True)
 
     class Meta:
         model = Subscription
         fields = ("following",)
 
     def validate(self, attrs):
-        user = self.context["request"].user
-        following = attrs["following"]
-        if user == following:
+        if attrs["following"] == self.context["request"].user.pk:
             raise serializers.ValidationError("Нельзя подписаться на себя")
-        if Subscription.objects.filter(
-            user=user,
-            following=following,
-        ).exists():
-            raise serializers.ValidationError("Уже подписаны")
-        attrs["user"] = user
         return attrs
 
+    def create(self, validated_data):
+        following_id = validated_data["following"]
+        following, subscription = subscribe(
+            self.context["request"].user,
+            following_id,
+        )
+        if following is None:
+            # Тот же ответ, что давал PrimaryKeyRelatedField.
+            messages = (
+                serializers.PrimaryKeyRelatedField.default_error_messages
+            )
+            message = messages["does_not_exist"]
+            raise serializers.ValidationError(
+                {"following": [message.format(pk_value=following_id)]},
+            )
+        if subscription is None:
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: ["Уже подписаны"]},
+            )
+        return subscription
+
 
 class SubscriptionSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField(source="following.id")
@@ -296,7 +621,9 @@ class SubscriptionSerializer(serializers.ModelSerializer):
     avatar = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(read_only=True)
+    recipes_count = serializers.ReadOnlyField(
+        source="following.recipes_count"
+    )
 
     class Meta:
         model = Subscription
@@ -325,14 +652,29 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         return True
 
     def get_recipes(self, obj):
-        qs = obj.following.recipes.all()[:3]
-        return RecipeReadSerializer(
-            qs,
+        # Список подписок заранее загружает превью всех авторов страницы
+        # (см. UserViewSet.subscriptions); одиночный объект — отдельно.
+        previews = self.context.get("recipe_previews")
+        if previews is not None:
+            recipes = previews.get(obj.following_id, [])
+        else:
+            limit = get_recipes_limit(self.context["request"])
+            recipes = obj.following.recipes.all()[:limit]
+        return RecipeShortSerializer(
+            recipes,
             many=True,
             context=self.context,
         ).data
 
 
+class RecipeImageSerializer(serializers.ModelSerializer):
+    image = Base64ImageField(required=True)
+
+    class Meta:
+        model = Recipe
+        fields = ("image",)
+
+
 class AvatarSerializer(serializers.ModelSerializer):
     avatar = Base64ImageField(required=True, use_url=True)
 
@@ -1,10 +1,14 @@
-from django.db.models import Count, F, Sum
+from collections import defaultdict
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef, Value
 from django.http import HttpResponse
 
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as BaseUserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.permissions import (
     AllowAny,
     IsAuthenticated,
@@ -12,10 +16,15 @@ from rest_framework.permissions import (
 )
 from rest_framework.response import Response
 from api.filters import IngredientFilter, RecipeFilter
+from api.mixins import ConditionalGetMixin, make_etag, table_etag
+from api.pagination import RecipeKeysetPagination
+from api.parsers import RawImageParser, image_payload
 from api.serializers import (
     AvatarSerializer,
     FavoriteCreateSerializer,
     IngredientSerializer,
+    RecipeIdsSerializer,
+    RecipeImageSerializer,
     RecipeReadSerializer,
     RecipeSerializer,
     ShoppingCartCreateSerializer,
@@ -24,8 +33,18 @@ from api.serializers import (
     TagSerializer,
     UserCreateSerializer,
     UserSerializer,
+    get_recipes_limit,
 )
-from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from recipes import relations
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+)
+from recipes.search import ingredient_index
 from users.models import Subscription, User
 
 
@@ -42,6 +61,20 @@ class UserViewSet(BaseUserViewSet):
             return [AllowAny()]
         return super().get_permissions()
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset
+        return queryset.annotate(
+            is_subscribed=Exists(
+                Subscription.objects.filter(
+                    user=user,
+                    following=OuterRef("pk"),
+                ),
+            ),
+        )
+
     @action(detail=False, methods=["get"], url_path="me")
     def me(self, request):
         if request.user.is_anonymous:
@@ -93,13 +126,19 @@ class UserViewSet(BaseUserViewSet):
         qs = (
             Subscription.objects.filter(user=request.user)
             .select_related("following")
-            .annotate(recipes_count=Count("following__recipes"))
+            .order_by("pk")
         )
         page = self.paginate_queryset(qs)
+        previews = defaultdict(list)
+        for recipe in Recipe.objects.latest_by_author(
+            [subscription.following_id for subscription in page],
+            get_recipes_limit(request),
+        ):
+            previews[recipe.author_id].append(recipe)
         serializer = SubscriptionSerializer(
             page,
             many=True,
-            context={"request": request},
+            context={"request": request, "recipe_previews": previews},
         )
         return self.get_paginated_response(serializer.data)
 
@@ -108,6 +147,7 @@ class UserViewSet(BaseUserViewSet):
         methods=["get", "patch", "put"],
         permission_classes=[IsAuthenticated],
         url_path="me/avatar",
+        parser_classes=(JSONParser, MultiPartParser, RawImageParser),
     )
     def avatar(self, request):
         if request.method == "GET":
@@ -119,7 +159,7 @@ class UserViewSet(BaseUserViewSet):
 
         serializer = AvatarSerializer(
             request.user,
-            data=request.data,
+            data=image_payload(request, "avatar"),
             context={"request": request},
             partial=True,
         )
@@ -128,29 +168,96 @@ class UserViewSet(BaseUserViewSet):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class CatalogViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    """Справочник без пагинации с условными GET по версии таблицы."""
+
+    pagination_class = None
+
+    def get_list_validators(self):
+        return table_etag(self.queryset.model), None
+
+    def get_object_validators(self):
+        updated = (
+            self.queryset.filter(pk=self.kwargs["pk"])
+            .values_list("updated", flat=True)
+            .first()
+            if self.kwargs["pk"].isdigit()
+            else None
+        )
+        if updated is None:
+            return None, None
+        return make_etag(self.kwargs["pk"], updated), updated
+
+
+class TagViewSet(CatalogViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
-    pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogViewSet):
+    """Справочник ингредиентов с поиском по началу названия.
+
+    По умолчанию список и поиск обслуживаются индексом в памяти воркера
+    (recipes.search) без запросов к БД; при INGREDIENT_SEARCH_IN_MEMORY
+    = False работает IngredientFilter. Параметр ``limit`` ограничивает
+    число результатов.
+    """
+
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
-    pagination_class = None
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.query_params["limit"])
+        except (KeyError, ValueError):
+            return None
+        return max(limit, 0)
+
+    def get_list_validators(self):
+        if not settings.INGREDIENT_SEARCH_IN_MEMORY:
+            return super().get_list_validators()
+        # Версия индекса совпадает по формату с table_etag, поэтому ETag
+        # не зависит от того, каким путём был получен ответ.
+        version = ingredient_index.get_version()
+        return make_etag(Ingredient._meta.label, *version), None
+
+    def list(self, request, *args, **kwargs):
+        if not settings.INGREDIENT_SEARCH_IN_MEMORY:
+            return super().list(request, *args, **kwargs)
+        return self._conditional(
+            self.get_list_validators(),
+            self._search,
+            request,
+        )
+
+    def _search(self, request):
+        results = ingredient_index.search(
+            request.query_params.get("name", ""),
+            self.get_limit(),
+        )
+        return Response(results)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        limit = self.get_limit()
+        if self.action == "list" and limit is not None:
+            queryset = queryset[:limit]
+        return queryset
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.select_related("author").prefetch_related(
-        "tags",
-        "ingredient_links__ingredient",
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    # Теги и ингредиенты подгружаются сериализатором только для рецептов,
+    # которых нет в кэше представлений (см. RecipeReadSerializer).
+    queryset = Recipe.objects.select_related("author").defer(
+        "search_vector"
     )
     serializer_class = RecipeSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    conditional_vary = ("Authorization",)
 
     def get_permissions(self):
         if self.action in (
@@ -161,13 +268,63 @@ class RecipeViewSet(viewsets.ModelViewSet):
             "delete_favorite",
             "shopping_cart",
             "delete_shopping_cart",
+            "favorite_bulk",
+            "delete_favorite_bulk",
+            "shopping_cart_bulk",
+            "delete_shopping_cart_bulk",
             "shopping_cart_list",
             "favorite_list",
             "download_shopping_cart",
+            "upload_image",
         ):
             return [IsAuthenticated()]
         return super().get_permissions()
 
+    @property
+    def paginator(self):
+        # Курсорный режим включается явно: ?pagination=cursor или cursor=…
+        params = self.request.query_params
+        if not hasattr(self, "_paginator") and (
+            "cursor" in params or params.get("pagination") == "cursor"
+        ):
+            self._paginator = RecipeKeysetPagination()
+        return super().paginator
+
+    def get_queryset(self):
+        return super().get_queryset().with_user_flags(self.request.user)
+
+    def get_object_validators(self):
+        # Тело ответа зависит от рецепта (Recipe.updated сдвигается и при
+        # правке тегов, ингредиентов и автора) и от флагов зрителя.
+        pk = self.kwargs["pk"]
+        if not pk.isdigit():
+            return None, None
+        user = self.request.user
+        queryset = self.get_queryset().filter(pk=pk)
+        if user.is_anonymous:
+            queryset = queryset.annotate(author_subscribed=Value(False))
+        else:
+            queryset = queryset.annotate(
+                author_subscribed=Exists(
+                    Subscription.objects.filter(
+                        user=user,
+                        following=OuterRef("author"),
+                    ),
+                ),
+            )
+        row = queryset.values_list(
+            "updated",
+            "is_favorited",
+            "is_in_shopping_cart",
+            "author_subscribed",
+        ).first()
+        if row is None:
+            return None, None
+        updated, *flags = row
+        # Last-Modified не учитывает флаги, поэтому только для анонимов.
+        last_modified = updated if user.is_anonymous else None
+        return make_etag(pk, updated, *flags), last_modified
+
     def _modify_relation(self, serializer_cls, request, pk, add=True):
         if add:
             serializer = serializer_cls(
@@ -175,9 +332,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 context={"request": request},
             )
             serializer.is_valid(raise_exception=True)
-            relation = serializer.save()
+            recipe = serializer.save()
             data = RecipeReadSerializer(
-                relation.recipe,
+                recipe,
                 context={"request": request},
             ).data
             return Response(data, status=status.HTTP_201_CREATED)
@@ -230,9 +387,49 @@ class RecipeViewSet(viewsets.ModelViewSet):
             add=False,
         )
 
+    def _bulk_relation(self, model, request, add=True):
+        """Добавляет или убирает сразу несколько рецептов: {"ids": [...]}.
+
+        Ответ — результат по каждому id: added / already_added,
+        removed / not_added или not_found.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        modify = relations.add if add else relations.remove
+        results = modify(
+            model,
+            request.user,
+            serializer.validated_data["ids"],
+        )
+        return Response(
+            {
+                "results": [
+                    {"id": pk, "status": result}
+                    for pk, result in results.items()
+                ],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    @action(detail=False, methods=["post"], url_path="favorite/bulk")
+    def favorite_bulk(self, request):
+        return self._bulk_relation(Favorite, request, add=True)
+
+    @favorite_bulk.mapping.delete
+    def delete_favorite_bulk(self, request):
+        return self._bulk_relation(Favorite, request, add=False)
+
+    @action(detail=False, methods=["post"], url_path="shopping_cart/bulk")
+    def shopping_cart_bulk(self, request):
+        return self._bulk_relation(ShoppingCart, request, add=True)
+
+    @shopping_cart_bulk.mapping.delete
+    def delete_shopping_cart_bulk(self, request):
+        return self._bulk_relation(ShoppingCart, request, add=False)
+
     @action(detail=False, methods=["get"], url_path="shopping_cart")
     def shopping_cart_list(self, request):
-        qs = Recipe.objects.filter(shoppingcart__user=request.user)
+        qs = self.get_queryset().filter(is_in_shopping_cart=True)
         page = self.paginate_queryset(qs)
         data = RecipeReadSerializer(
             page,
@@ -243,7 +440,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=["get"], url_path="favorite")
     def favorite_list(self, request):
-        qs = Recipe.objects.filter(favorite__user=request.user)
+        qs = self.get_queryset().filter(is_favorited=True)
         page = self.paginate_queryset(qs)
         data = RecipeReadSerializer(
             page,
@@ -253,15 +450,15 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return self.get_paginated_response(data)
 
     def _build_shopping_list_text(self, request):
+        # Итоги поддерживаются инкрементально (recipes.shopping_list).
         items = (
-            IngredientInRecipe.objects.filter(
-                recipe__shoppingcart__user=request.user,
-            )
+            ShoppingListItem.objects.filter(user=request.user)
+            .order_by("ingredient__name")
             .values(
+                "total",
                 name=F("ingredient__name"),
                 unit=F("ingredient__measurement_unit"),
             )
-            .annotate(total=Sum("amount"))
         )
         return "\n".join(
             f"{item['name']} — {item['total']} {item['unit']}"
@@ -281,6 +478,28 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
         return response
 
+    @action(
+        detail=True,
+        methods=["put"],
+        url_path="image",
+        parser_classes=(MultiPartParser, RawImageParser),
+    )
+    def upload_image(self, request, pk=None):
+        """Замена изображения файлом: multipart (поле image) или image/*."""
+        recipe = self.get_object()
+        if recipe.author_id != request.user.id:
+            raise PermissionDenied("Изменять рецепт может только автор")
+        serializer = RecipeImageSerializer(
+            recipe,
+            data=image_payload(request, "image"),
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        data = RecipeReadSerializer(
+            recipe, context={"request": request}
+        ).data
+        return Response(data, status=status.HTTP_200_OK)
+
     @action(detail=True, methods=["get"], url_path="get-link")
     def get_link(self, request, pk=None):
         recipe = self.get_object()
@@ -0,0 +1,73 @@
+import os
+from django.http import HttpResponse
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Метрики API по представлениям «basename.action» (foodgram.middleware).
+# Под gunicorn каждый воркер пишет значения в файлы каталога
+# PROMETHEUS_MULTIPROC_DIR (задаётся в gunicorn.conf.py), а эндпоинт
+# метрик складывает их по всем воркерам.
+
+REQUEST_DURATION = Histogram(
+    "foodgram_request_duration_seconds",
+    "Время ответа на запрос",
+    ["view"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS = Counter(
+    "foodgram_requests",
+    "Обработанные запросы по коду ответа",
+    ["view", "status"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "foodgram_requests_in_progress",
+    "Запросы, которые обрабатываются сейчас",
+    ["view"],
+    multiprocess_mode="livesum",
+)
+EXCEPTIONS = Counter(
+    "foodgram_request_exceptions",
+    "Необработанные исключения в представлениях",
+    ["view", "exception"],
+)
+DB_QUERIES = Counter(
+    "foodgram_db_queries",
+    "Запросы к БД",
+    ["view"],
+)
+DB_QUERY_ERRORS = Counter(
+    "foodgram_db_query_errors",
+    "Запросы к БД, завершившиеся ошибкой",
+    ["view"],
+)
+DB_DURATION = Counter(
+    "foodgram_db_query_duration_seconds",
+    "Суммарное время запросов к БД",
+    ["view"],
+)
+
+
+def registry():
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    # Реестр собирается на каждый запрос: файлы воркеров меняются.
+    collected = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collected)
+    return collected
+
+
+def metrics_view(request):
+    """Эндпоинт для Prometheus; шлюз nginx его наружу не проксирует."""
+    return HttpResponse(
+        generate_latest(registry()),
+        content_type=CONTENT_TYPE_LATEST,
+    )
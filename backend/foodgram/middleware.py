@@ -0,0 +1,222 @@
+import json
+import logging
+import random
+import time
+from django.conf import settings
+from django.db import connection
+
+from foodgram import metrics
+
+logger = logging.getLogger(__name__)
+
+# Сколько символов самого долгого SQL попадает в лог.
+SLOWEST_SQL_LENGTH = 300
+# Метка метрик для запросов, не дошедших до представления (404 по URL).
+UNRESOLVED_VIEW = "unresolved"
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def view_key(view_func, method):
+    """Имя представления «basename.action», как в QUERY_BUDGETS.
+
+    Для вьюсетов DRF берётся basename роутера и действие по методу
+    запроса, для остальных — модуль и имя класса или функции.
+    """
+    actions = getattr(view_func, "actions", None)
+    initkwargs = getattr(view_func, "initkwargs", None) or {}
+    if actions and "basename" in initkwargs:
+        method = method.lower()
+        # HEAD обслуживается действием GET (ViewSetMixin.as_view).
+        if method == "head" and "head" not in actions:
+            method = "get"
+        return f"{initkwargs['basename']}.{actions.get(method, method)}"
+    view = getattr(view_func, "view_class", view_func)
+    return f"{view.__module__}.{view.__qualname__}"
+
+
+class RequestTimings:
+    """Замеры одного запроса; сам объект — обёртка для execute_wrapper."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view = None
+        self.view_started = self.render_started = None
+        self.render_finished = None
+        self.queries = 0
+        self.db = 0.0
+        self.slowest = 0.0
+        self.slowest_sql = ""
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db += elapsed
+            if elapsed > self.slowest:
+                self.slowest = elapsed
+                self.slowest_sql = sql
+
+    def rendered(self, response):
+        self.render_finished = time.perf_counter()
+
+    def spans(self, finished):
+        """Длительности в миллисекундах: db, app, render и total.
+
+        app — время представления без SQL: в основном сериализация.
+        render — перевод ответа в байты рендерером DRF.
+        """
+        spans = {"db": self.db}
+        if self.view_started is not None:
+            view_finished = self.render_started or finished
+            spans["app"] = max(
+                view_finished - self.view_started - self.db,
+                0.0,
+            )
+        if self.render_started and self.render_finished:
+            spans["render"] = self.render_finished - self.render_started
+        spans["total"] = finished - self.started
+        return {name: value * 1000 for name, value in spans.items()}
+
+
+class RequestTimingMiddleware:
+    """Число и время запросов к БД, время сериализации и рендеринга.
+
+    Замеряется доля запросов REQUEST_TIMING_SAMPLE_RATE; остальные
+    проходят без обёрток. Результат уходит в заголовок Server-Timing и
+    строкой JSON в лог foodgram.middleware. Если представление сделало
+    больше запросов к БД, чем задано для него в QUERY_BUDGETS, в лог
+    пишется предупреждение, а при QUERY_BUDGET_STRICT бросается
+    QueryBudgetExceeded — так бюджеты проверяются в тестах.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.REQUEST_TIMING_SAMPLE_RATE
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return self.get_response(request)
+        timings = request._timings = RequestTimings()
+        with connection.execute_wrapper(timings):
+            response = self.get_response(request)
+        spans = timings.spans(time.perf_counter())
+        header = [
+            f"{name};dur={value:.1f}" for name, value in spans.items()
+        ]
+        header[0] += f';desc="{timings.queries} queries"'
+        response["Server-Timing"] = ", ".join(header)
+        self._log(request, response, timings, spans)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = getattr(request, "_timings", None)
+        if timings is not None:
+            timings.view = view_key(view_func, request.method)
+            timings.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Вызывается сразу после представления, до render() ответа DRF.
+        timings = getattr(request, "_timings", None)
+        if timings is not None:
+            timings.render_started = time.perf_counter()
+            response.add_post_render_callback(timings.rendered)
+        return response
+
+    @staticmethod
+    def _log(request, response, timings, spans):
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "view": timings.view,
+            "status": response.status_code,
+            "queries": timings.queries,
+            **{
+                f"{name}_ms": round(value, 2)
+                for name, value in spans.items()
+            },
+        }
+        if timings.queries:
+            record["slowest_sql_ms"] = round(timings.slowest * 1000, 2)
+            record["slowest_sql"] = timings.slowest_sql[:SLOWEST_SQL_LENGTH]
+        logger.info(json.dumps(record, ensure_ascii=False))
+
+        budget = settings.QUERY_BUDGETS.get(timings.view)
+        if budget is None or timings.queries <= budget:
+            return
+        message = (
+            f"{timings.view}: {timings.queries} запросов к БД "
+            f"при бюджете {budget} ({request.method} {request.path})"
+        )
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+class QueryCounter:
+    """Число, ошибки и время запросов к БД; обёртка для execute_wrapper."""
+
+    def __init__(self):
+        self.view = None
+        self.queries = self.errors = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.queries += 1
+            self.duration += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """Метрики Prometheus по каждому запросу (foodgram.metrics).
+
+    В отличие от RequestTimingMiddleware работает без выборки: счётчики
+    дёшевы, а пропуски исказили бы пропускную способность. Метка view —
+    «basename.action», как в QUERY_BUDGETS.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        counter = request._query_counter = QueryCounter()
+        try:
+            with connection.execute_wrapper(counter):
+                response = self.get_response(request)
+        finally:
+            if counter.view is not None:
+                metrics.REQUESTS_IN_PROGRESS.labels(counter.view).dec()
+        view = counter.view or UNRESOLVED_VIEW
+        metrics.REQUEST_DURATION.labels(view).observe(
+            time.perf_counter() - started,
+        )
+        metrics.REQUESTS.labels(view, response.status_code).inc()
+        if counter.queries:
+            metrics.DB_QUERIES.labels(view).inc(counter.queries)
+            metrics.DB_DURATION.labels(view).inc(counter.duration)
+        if counter.errors:
+            metrics.DB_QUERY_ERRORS.labels(view).inc(counter.errors)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        counter = request._query_counter
+        counter.view = view_key(view_func, request.method)
+        metrics.REQUESTS_IN_PROGRESS.labels(counter.view).inc()
+
+    def process_exception(self, request, exception):
+        metrics.EXCEPTIONS.labels(
+            request._query_counter.view or UNRESOLVED_VIEW,
+            type(exception).__name__,
+        ).inc()
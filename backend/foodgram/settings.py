@@ -34,6 +34,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "foodgram.middleware.MetricsMiddleware",
+    "foodgram.middleware.RequestTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -109,12 +111,95 @@ STATICFILES_DIRS = []
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+# Файлы именуются по хэшу содержимого и не дублируются (foodgram.storage).
+DEFAULT_FILE_STORAGE = "foodgram.storage.ContentAddressedStorage"
 
 AUTH_USER_MODEL = "users.User"
 
+# По умолчанию кэш локален для процесса. Представления рецептов от этого
+# не устаревают — в их ключ входит Recipe.updated (recipes.cache), — но
+# при нескольких воркерах gunicorn общий бэкенд (memcached, файловый и
+# т.п.) экономит память и повторную отрисовку.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND",
+            "django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    },
+}
+
+# Поиск ингредиентов по префиксу в памяти воркера (recipes.search) и то,
+# как часто (в секундах) сверять его с таблицей на правки из других
+# процессов.
+INGREDIENT_SEARCH_IN_MEMORY = (
+    os.getenv("INGREDIENT_SEARCH_IN_MEMORY", "True") == "True"
+)
+INGREDIENT_SEARCH_REFRESH = int(os.getenv("INGREDIENT_SEARCH_REFRESH", 30))
+
+# Время жизни закэшированного представления рецепта, секунды.
+RECIPE_CACHE_TIMEOUT = int(os.getenv("RECIPE_CACHE_TIMEOUT", 60 * 60 * 24))
+
+# Изображения: предельный размер загружаемого файла, формат уменьшенных
+# копий (WEBP или JPEG) и пул потоков, который их строит
+# (recipes.images). При IMAGE_PROCESSING_ASYNC = False копии строятся
+# сразу после коммита, в том же потоке.
+IMAGE_UPLOAD_MAX_BYTES = int(
+    os.getenv("IMAGE_UPLOAD_MAX_BYTES", 15 * 1024 * 1024),
+)
+IMAGE_VARIANT_FORMAT = os.getenv("IMAGE_VARIANT_FORMAT", "WEBP")
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 2))
+IMAGE_PROCESSING_ASYNC = (
+    os.getenv("IMAGE_PROCESSING_ASYNC", "True") == "True"
+)
+
+# Файлы multipart и «сырых» загрузок сразу пишутся во временные файлы
+# с тем же ограничением размера (api.parsers).
+FILE_UPLOAD_HANDLERS = ["api.parsers.LimitedTemporaryFileUploadHandler"]
+
+# Замер запросов к БД и времени ответа (foodgram.middleware): доля
+# замеряемых запросов (0 — замер выключен) и бюджеты числа запросов к БД
+# по представлениям «basename.action». Превышение бюджета пишется в лог,
+# а при QUERY_BUDGET_STRICT = True становится ошибкой; в тестах удобно
+# замерять все запросы (REQUEST_TIMING_SAMPLE_RATE = 1).
+REQUEST_TIMING_SAMPLE_RATE = float(
+    os.getenv("REQUEST_TIMING_SAMPLE_RATE", 0.1),
+)
+QUERY_BUDGETS = {
+    "recipes.list": 8,
+    "recipes.retrieve": 8,
+    "users.subscriptions": 8,
+    "recipes.download_shopping_cart": 4,
+    "ingredients.list": 3,
+}
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "False") == "True"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "foodgram.middleware": {
+            "handlers": ["console"],
+            "level": os.getenv("REQUEST_TIMING_LOG_LEVEL", "INFO"),
+            "propagate": False,
+        },
+    },
+}
+
+# Кэш «токен → пользователь» для users.authentication: срок записи в
+# секундах, число записей в процессе и дублирование в общий кэш CACHES
+# (имеет смысл, только если он общий для воркеров).
+TOKEN_CACHE_TIMEOUT = int(os.getenv("TOKEN_CACHE_TIMEOUT", 60))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+TOKEN_CACHE_SHARED = os.getenv("TOKEN_CACHE_SHARED", "False") == "True"
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "users.authentication.CachedTokenAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
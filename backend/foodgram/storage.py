@@ -0,0 +1,63 @@
+import hashlib
+import os
+import posixpath
+import re
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+# <каталог>/ab/cd/<sha256>.<расширение>
+HASHED_NAME = re.compile(
+    r"(^|/)([0-9a-f]{2})/([0-9a-f]{2})/\2\3[0-9a-f]{60}(\.\w+)?$",
+)
+
+
+def file_digest(file):
+    """SHA-256 содержимого файла, прочитанного кусками."""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hashed_name(name, digest):
+    """Имя файла по хэшу: каталог из ``name``, шардирование по префиксу."""
+    directory = posixpath.dirname(name)
+    ext = posixpath.splitext(name)[1].lower()
+    return posixpath.join(
+        directory,
+        digest[:2],
+        digest[2:4],
+        f"{digest}{ext}",
+    )
+
+
+def is_hashed_name(name):
+    return bool(HASHED_NAME.search(name))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, где имя файла — SHA-256 его содержимого.
+
+    Одинаковые загрузки занимают место на диске один раз: если файл с
+    таким хэшем уже есть, сохранение просто возвращает его имя. Файлы
+    раскладываются по подкаталогам из первых символов хэша
+    (``recipes/images/ab/cd/abcd….png``), так что ни в одном каталоге
+    не скапливаются сотни тысяч записей.
+
+    Один файл может принадлежать нескольким объектам, поэтому удалять
+    его при удалении объекта нельзя — неиспользуемые файлы убирает
+    сборщик мусора по ссылкам из базы.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        name = hashed_name(name, file_digest(content))
+        if self.exists(name):
+            # Файл снова используется: свежий mtime уберегает его от
+            # сборщика мусора на льготный период.
+            os.utime(self.path(name))
+            return name
+        return self._save(name, content)
@@ -4,6 +4,8 @@ from django.contrib import admin
 from django.urls import include, path, re_path
 from django.views.generic import TemplateView
 
+from foodgram.metrics import metrics_view
+
 urlpatterns = [
     # Grappelli (тема админки)
     path("grappelli/", include("grappelli.urls")),
@@ -14,6 +16,8 @@ urlpatterns = [
     # Djoser аутентификация
     path("api/auth/", include("djoser.urls")),
     path("api/auth/", include("djoser.urls.authtoken")),
+    # Метрики для Prometheus (foodgram.metrics)
+    path("metrics", metrics_view),
 ]
 
 if settings.DEBUG:
@@ -29,7 +33,7 @@ if settings.DEBUG:
 # Всё остальное — отдаём React-приложение
 urlpatterns += [
     re_path(
-        r"^(?!api/|static/|media/).*$",
+        r"^(?!api/|static/|media/|metrics$).*$",
         TemplateView.as_view(template_name="index.html"),
     ),
 ]
@@ -0,0 +1,20 @@
+import os
+import shutil
+
+# Метрики воркеров складываются в файлы этого каталога (foodgram.metrics).
+# Переменная задаётся до загрузки приложения, чтобы prometheus_client
+# в каждом воркере запустился в многопроцессном режиме.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus")
+
+
+def on_starting(server):
+    # Файлы прошлого запуска исказили бы счётчики.
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,6 +1,5 @@
 import csv
 from django.contrib import admin
-from django.db.models import Count
 from django.http import HttpResponse
 from django.utils.html import format_html
 
@@ -34,7 +33,8 @@ class RecipeAdmin(admin.ModelAdmin):
         "name",
         "author",
         "cooking_time",
-        "favorite_count",
+        "favorites_count",
+        "in_carts_count",
         "image_thumbnail",
         "id",
     )
@@ -50,14 +50,8 @@ class RecipeAdmin(admin.ModelAdmin):
         js = ("admin/js/positive_only.js",)
 
     def get_queryset(self, request):
-        qs = (
-            super()
-            .get_queryset(request)
-            .select_related("author")
-            .prefetch_related("tags", "ingredientinrecipe_set__ingredient")
-            .annotate(favorite_count=Count("favorite"))
-        )
-        return qs
+        # Счётчики денормализованы в Recipe, агрегаты не нужны.
+        return super().get_queryset(request).select_related("author")
 
     @admin.display(description="Фото")
     def image_thumbnail(self, obj):
@@ -68,10 +62,6 @@ class RecipeAdmin(admin.ModelAdmin):
             )
         return "-"
 
-    @admin.display(description="В избранном", ordering="favorite_count")
-    def favorite_count(self, obj):
-        return obj.favorite_count
-
     @admin.action(description="Экспорт выбранных рецептов в CSV")
     def export_to_csv(self, request, queryset):
         field_names = ["id", "name", "author", "cooking_time"]
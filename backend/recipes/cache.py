@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from recipes.models import Recipe
+
+# Версия формата представления: увеличивается при изменении его структуры,
+# чтобы после деплоя не читать записи, сохранённые прежним кодом.
+REPRESENTATION_VERSION = 2
+
+
+def representation_key(recipe_id, updated):
+    """Ключ записи: id рецепта и его Recipe.updated.
+
+    Любая правка рецепта и связанных данных сдвигает updated, поэтому
+    устаревшая запись становится недостижимой во всех процессах — даже
+    если её дописал читатель, загрузивший строку до коммита, или она
+    лежит в кэше другого воркера.
+    """
+    return (
+        f"recipe-repr:{REPRESENTATION_VERSION}:{recipe_id}:"
+        f"{updated.isoformat()}"
+    )
+
+
+def get_representations(recipes, render):
+    """Общие для всех зрителей представления рецептов по их id.
+
+    Всё, что есть в кэше, читается одним get_many; промахи отрисовываются
+    вызовом ``render(recipes) -> {id: data}`` и сохраняются в кэш.
+    """
+    keys = {
+        recipe.pk: representation_key(recipe.pk, recipe.updated)
+        for recipe in recipes
+    }
+    cached = cache.get_many(keys.values())
+    result = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    missing = [recipe for recipe in recipes if recipe.pk not in result]
+    if missing:
+        rendered = render(missing)
+        cache.set_many(
+            {keys[pk]: data for pk, data in rendered.items()},
+            settings.RECIPE_CACHE_TIMEOUT,
+        )
+        result.update(rendered)
+    return result
+
+
+def invalidate_representations(recipe_ids):
+    """Удаляет записи текущих версий рецептов.
+
+    Для корректности это не нужно — после сдвига updated запись и так
+    недостижима, — но освобождает место в кэше. Вызывается до того, как
+    updated сдвинется.
+    """
+    cache.delete_many(
+        [
+            representation_key(pk, updated)
+            for pk, updated in Recipe.objects.filter(
+                pk__in=recipe_ids,
+            ).values_list("pk", "updated")
+        ],
+    )
@@ -0,0 +1,61 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+User = get_user_model()
+
+# Счётчик рецепта для каждой связи «пользователь — рецепт».
+RELATION_COUNTERS = {
+    Favorite: "favorites_count",
+    ShoppingCart: "in_carts_count",
+}
+
+# (модель счётчика, поле, модель строк, внешний ключ на модель счётчика)
+COUNTERS = (
+    (Recipe, "favorites_count", Favorite, "recipe"),
+    (Recipe, "in_carts_count", ShoppingCart, "recipe"),
+    (User, "recipes_count", Recipe, "author"),
+)
+
+
+def adjust(model, field, pk, delta):
+    """Сдвигает счётчик одним UPDATE с F-выражением.
+
+    Вызывается из обработчиков сигналов, то есть в той же транзакции, что
+    и запись связи. Ниже нуля счётчик не опускается, даже если разошёлся.
+    """
+    adjust_many(model, field, [pk], delta)
+
+
+def adjust_many(model, field, pks, delta):
+    """То же для нескольких строк сразу — после массовых операций."""
+    value = F(field) + delta if delta > 0 else Greatest(F(field) + delta, 0)
+    model.objects.filter(pk__in=pks).update(**{field: value})
+
+
+def reconcile():
+    """Пересчитывает все счётчики по фактическим строкам.
+
+    Каждый счётчик чинится одним UPDATE, который трогает только
+    разошедшиеся строки. Возвращает {(модель, поле): исправлено строк}.
+    """
+    fixed = {}
+    for model, field, source, key in COUNTERS:
+        actual = Coalesce(
+            Subquery(
+                source.objects.filter(**{key: OuterRef("pk")})
+                .order_by()
+                .values(key)
+                .annotate(count=Count("pk"))
+                .values("count"),
+            ),
+            0,
+        )
+        fixed[model, field] = (
+            model.objects.annotate(actual=actual)
+            .exclude(**{field: F("actual")})
+            .update(**{field: actual})
+        )
+    return fixed
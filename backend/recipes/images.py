@@ -0,0 +1,200 @@
+import binascii
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import logging
+import posixpath
+import threading
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import connections
+from django.utils import timezone
+
+from PIL import Image, ImageOps
+from recipes.cache import invalidate_representations
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+# Варианты изображения рецепта: имя -> рамка (ширина, высота), от большего
+# к меньшему — каждый следующий уменьшается из предыдущего.
+VARIANTS = {
+    "full": (1280, 1280),
+    "card": (480, 480),
+    "thumb": (160, 160),
+}
+VARIANTS_DIR = "recipes/images/variants"
+EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg"}
+
+# Кусок base64 для декодирования за раз.
+DECODE_CHUNK = 64 * 1024
+# Символы вне алфавита base64 (переводы строк, пробелы) a2b_base64
+# пропускает, поэтому они выбрасываются до нарезки на группы по 4.
+BASE64_ALPHABET = (
+    b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
+)
+NON_BASE64 = bytes(set(range(256)) - set(BASE64_ALPHABET))
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class TemporaryImageFile(TemporaryUploadedFile):
+    """Загруженное изображение во временном файле на диске.
+
+    Хранилище может переместить файл на место (file_move_safe), поэтому
+    он закрывается при сборке мусора через TemporaryUploadedFile.close,
+    который спокойно относится к уже исчезнувшему файлу.
+    """
+
+    def __del__(self):
+        self.close()
+
+
+def _base64_pieces(encoded):
+    # Куски из целых групп по 4 символа: неполная группа в конце куска
+    # переносится в следующий, последним идёт остаток — если он неполон,
+    # a2b_base64 сообщит об ошибке.
+    leftover = b""
+    for start in range(0, len(encoded), DECODE_CHUNK):
+        data = leftover + encoded[start : start + DECODE_CHUNK].encode(
+            "ascii",
+        ).translate(None, NON_BASE64)
+        whole = len(data) - len(data) % 4
+        leftover = data[whole:]
+        yield data[:whole]
+    yield leftover
+
+
+def decode_base64_image(encoded, name, content_type=""):
+    """Декодирует base64 во временный файл, не превышая лимит размера.
+
+    Данные декодируются кусками и сразу пишутся на диск, так что в памяти
+    не появляется вторая копия изображения, а слишком большой файл
+    отбрасывается, не дойдя до конца. Лимит — IMAGE_UPLOAD_MAX_BYTES.
+    Переводы строк и пробелы внутри данных допускаются.
+    Бросает ImageTooLarge или binascii.Error.
+    """
+    limit = settings.IMAGE_UPLOAD_MAX_BYTES
+    # Верхняя оценка размера известна заранее — отказываем сразу.
+    if len(encoded) // 4 * 3 > limit + 2:
+        raise ImageTooLarge(limit)
+    upload = TemporaryImageFile(name, content_type, 0, None)
+    try:
+        for piece in _base64_pieces(encoded):
+            chunk = binascii.a2b_base64(piece)
+            upload.size += len(chunk)
+            if upload.size > limit:
+                raise ImageTooLarge(limit)
+            upload.write(chunk)
+    except (ImageTooLarge, binascii.Error, UnicodeEncodeError):
+        upload.close()
+        raise
+    upload.seek(0)
+    return upload
+
+
+def needs_variants(recipe):
+    if not recipe.image:
+        return False
+    variants = recipe.image_variants or {}
+    return variants.get("source") != recipe.image.name
+
+
+def variant_urls(recipe):
+    """URL вариантов изображения рецепта (относительные, как image.url).
+
+    Пока варианты не готовы или относятся к прежнему файлу, вместо
+    каждого из них отдаётся оригинал.
+    """
+    if not recipe.image:
+        return {}
+    if needs_variants(recipe):
+        return {variant: recipe.image.url for variant in VARIANTS}
+    return {
+        variant: default_storage.url(recipe.image_variants[variant])
+        for variant in VARIANTS
+    }
+
+
+def build_variants(name):
+    """Сохраняет уменьшенные копии файла ``name`` и возвращает их пути.
+
+    Результат — {"source": name, вариант: путь, ...}; формат задаётся
+    IMAGE_VARIANT_FORMAT (WEBP или JPEG).
+    """
+    image_format = settings.IMAGE_VARIANT_FORMAT
+    stem = posixpath.splitext(posixpath.basename(name))[0]
+    variants = {"source": name}
+    with default_storage.open(name) as source, Image.open(source) as image:
+        # JPEG можно сразу декодировать в уменьшенном масштабе.
+        image.draft("RGB", max(VARIANTS.values()))
+        image = ImageOps.exif_transpose(image)
+        if image_format == "JPEG" or image.mode not in ("RGB", "RGBA"):
+            image = image.convert(
+                "RGB" if image_format == "JPEG" else "RGBA"
+            )
+        for variant, size in VARIANTS.items():
+            image.thumbnail(size, Image.LANCZOS)
+            buffer = BytesIO()
+            image.save(buffer, image_format, quality=82, optimize=True)
+            variants[variant] = default_storage.save(
+                posixpath.join(
+                    VARIANTS_DIR,
+                    f"{stem}_{variant}.{EXTENSIONS[image_format]}",
+                ),
+                ContentFile(buffer.getvalue()),
+            )
+    return variants
+
+
+def process_recipe_image(recipe_id, name):
+    """Строит варианты изображения и записывает их в рецепт.
+
+    Если за время обработки у рецепта сменилось изображение, результат
+    не записывается: новый файл обработает свой вызов. Сами копии не
+    удаляются — в хранилище с дедупликацией ими могут пользоваться другие
+    рецепты; лишние файлы убирает сборщик мусора.
+    """
+    try:
+        variants = build_variants(name)
+    except Exception:
+        logger.exception("Не удалось обработать изображение %s", name)
+        return
+    invalidate_representations([recipe_id])
+    Recipe.objects.filter(pk=recipe_id, image=name).update(
+        image_variants=variants,
+        updated=timezone.now(),
+    )
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _run_in_worker(recipe_id, name):
+    try:
+        process_recipe_image(recipe_id, name)
+    finally:
+        connections.close_all()
+
+
+def schedule_variants(recipe_id, name):
+    """Ставит обработку изображения в пул потоков (IMAGE_WORKERS).
+
+    Пул создаётся при первом вызове, то есть уже в дочернем процессе
+    gunicorn. При IMAGE_PROCESSING_ASYNC = False обработка идёт сразу.
+    """
+    global _executor
+    if not settings.IMAGE_PROCESSING_ASYNC:
+        process_recipe_image(recipe_id, name)
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                thread_name_prefix="recipe-images",
+            )
+    _executor.submit(_run_in_worker, recipe_id, name)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from recipes import images
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Строит уменьшенные копии изображений рецептов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Перестроить копии и для уже обработанных рецептов",
+        )
+
+    def handle(self, *args, **options):
+        processed = 0
+        recipes = Recipe.objects.only("id", "image", "image_variants")
+        for recipe in recipes.iterator():
+            if not recipe.image:
+                continue
+            if options["force"] or images.needs_variants(recipe):
+                images.process_recipe_image(recipe.pk, recipe.image.name)
+                processed += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Обработано изображений: {processed}"),
+        )
@@ -0,0 +1,147 @@
+from array import array
+from bisect import bisect_left
+import hashlib
+import heapq
+from itertools import islice
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from users.models import User
+
+# Сколько путей читать и сортировать за раз.
+RUN_SIZE = 100_000
+
+
+def path_key(name):
+    """64-битный ключ пути файла относительно MEDIA_ROOT.
+
+    Совпадение ключей у разных путей лишь сохраняет лишний файл,
+    поэтому для сборки мусора такого хэша достаточно.
+    """
+    digest = hashlib.blake2b(name.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет из MEDIA_ROOT изображения рецептов и аватары, "
+        "на которые больше не ссылается база"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-hours",
+            type=float,
+            default=24,
+            help="Не трогать файлы моложе указанного числа часов",
+        )
+        parser.add_argument(
+            "--quarantine",
+            metavar="DIR",
+            help="Переносить файлы в каталог вместо удаления",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только посчитать файлы, ничего не меняя",
+        )
+
+    def handle(self, *args, **options):
+        # Файлы новее порога не трогаем: их запись в базу могла ещё не
+        # закоммититься к моменту сбора ссылок.
+        deadline = time.time() - options["grace_hours"] * 3600
+        referenced = self._referenced_keys()
+        quarantine = options["quarantine"]
+        removed = reclaimed = 0
+
+        for directory in self._upload_dirs():
+            for entry in self._walk(directory, quarantine):
+                name = os.path.relpath(entry.path, settings.MEDIA_ROOT)
+                name = name.replace(os.sep, "/")
+                stat = entry.stat(follow_symlinks=False)
+                if stat.st_mtime > deadline:
+                    continue
+                key = path_key(name)
+                position = bisect_left(referenced, key)
+                if (
+                    position < len(referenced)
+                    and referenced[position] == key
+                ):
+                    continue
+                removed += 1
+                reclaimed += stat.st_size
+                if options["dry_run"]:
+                    self.stdout.write(name)
+                elif quarantine:
+                    target = os.path.join(quarantine, name)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    os.replace(entry.path, target)
+                else:
+                    os.remove(entry.path)
+
+        action = "Найдено" if options["dry_run"] else "Убрано"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{action} неиспользуемых файлов: {removed}, "
+                f"освобождено байт: {reclaimed}",
+            ),
+        )
+
+    @staticmethod
+    def _upload_dirs():
+        fields = (
+            Recipe._meta.get_field("image"),
+            User._meta.get_field("avatar"),
+        )
+        for field in fields:
+            directory = os.path.join(settings.MEDIA_ROOT, field.upload_to)
+            if os.path.isdir(directory):
+                yield directory
+
+    @staticmethod
+    def _referenced_paths():
+        recipes = Recipe.objects.exclude(image="").values_list(
+            "image",
+            "image_variants",
+        )
+        for image, variants in recipes.iterator(chunk_size=RUN_SIZE):
+            yield image
+            yield from variants.values()
+        avatars = User.objects.exclude(avatar="").values_list(
+            "avatar",
+            flat=True,
+        )
+        yield from avatars.iterator(chunk_size=RUN_SIZE)
+
+    def _referenced_keys(self):
+        """Отсортированный массив ключей всех путей, на которые есть ссылки.
+
+        Пути читаются из базы потоком и сортируются отрезками, которые
+        затем сливаются, так что в памяти остаётся около 16 байт на файл —
+        миллионы ссылок укладываются в десятки мегабайт.
+        """
+        runs = []
+        paths = self._referenced_paths()
+        while True:
+            run = sorted(map(path_key, islice(paths, RUN_SIZE)))
+            if not run:
+                break
+            runs.append(array("Q", run))
+        return array("Q", heapq.merge(*runs))
+
+    @staticmethod
+    def _walk(directory, skip):
+        """Обходит дерево каталогов через os.scandir без рекурсии."""
+        skip = skip and os.path.abspath(skip)
+        stack = [directory]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if os.path.abspath(entry.path) != skip:
+                            stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
@@ -0,0 +1,116 @@
+import base64
+import json
+import sys
+import time
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import prefetch_related_objects
+
+from recipes.models import Recipe
+
+
+def recipe_record(recipe, inline_images=False):
+    """Строка выгрузки: рецепт со ссылками на автора, теги и ингредиенты.
+
+    Автор и теги задаются email и slug, ингредиенты — названием и единицей,
+    так что файл можно загрузить в базу с другими id (import_recipes).
+    """
+    record = {
+        "id": recipe.pk,
+        "author": recipe.author.email,
+        "name": recipe.name,
+        "text": recipe.text,
+        "cooking_time": recipe.cooking_time,
+        "tags": [tag.slug for tag in recipe.tags.all()],
+        "ingredients": [
+            {
+                "name": link.ingredient.name,
+                "measurement_unit": link.ingredient.measurement_unit,
+                "amount": link.amount,
+            }
+            for link in recipe.ingredient_links.all()
+        ],
+        "image": recipe.image.name,
+    }
+    if inline_images and recipe.image:
+        with default_storage.open(recipe.image.name) as image:
+            record["image_data"] = base64.b64encode(image.read()).decode()
+    return record
+
+
+class Command(BaseCommand):
+    help = "Выгружает рецепты в JSON Lines: по рецепту на строку"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            nargs="?",
+            default="-",
+            help="Файл для выгрузки; по умолчанию stdout",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Сколько рецептов читать за раз",
+        )
+        parser.add_argument(
+            "--inline-images",
+            action="store_true",
+            help="Включать изображения в base64, а не только путь",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        started = time.monotonic()
+        if path == "-":
+            total = self._export(sys.stdout, options)
+        else:
+            with open(path, "w", encoding="utf-8") as output:
+                total = self._export(output, options)
+        elapsed = time.monotonic() - started
+        # Отчёт — в stderr, чтобы не смешиваться с выгрузкой в stdout.
+        self.stderr.write(
+            self.style.SUCCESS(
+                f"Выгружено рецептов: {total} за {elapsed:.2f} с "
+                f"({total / max(elapsed, 1e-6):.0f} строк/с)",
+            ),
+        )
+
+    def _export(self, output, options):
+        """Читает рецепты пачками по возрастанию id.
+
+        iterator() не умеет prefetch_related, поэтому пачки выбираются
+        по ключу (id > последнего) и к каждой подгружаются теги и
+        ингредиенты — память не растёт с размером базы.
+        """
+        queryset = (
+            Recipe.objects.order_by("pk")
+            .select_related("author")
+            .only(
+                "id",
+                "name",
+                "text",
+                "cooking_time",
+                "image",
+                "author__email",
+            )
+        )
+        total = last_pk = 0
+        while True:
+            batch = list(
+                queryset.filter(pk__gt=last_pk)[: options["batch_size"]],
+            )
+            if not batch:
+                return total
+            prefetch_related_objects(
+                batch,
+                "tags",
+                "ingredient_links__ingredient",
+            )
+            for recipe in batch:
+                record = recipe_record(recipe, options["inline_images"])
+                output.write(json.dumps(record, ensure_ascii=False))
+                output.write("\n")
+            total += len(batch)
+            last_pk = batch[-1].pk
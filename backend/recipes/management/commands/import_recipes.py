@@ -0,0 +1,313 @@
+import base64
+import binascii
+from collections import defaultdict
+from itertools import islice
+import json
+import posixpath
+import sys
+import time
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes import counters
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from recipes.search import ingredient_index
+from recipes.signals import notify_recipes_changed
+from users.models import User
+
+# Обязательные ключи записи и ингредиента в ней.
+RECORD_KEYS = (
+    "author",
+    "name",
+    "text",
+    "cooking_time",
+    "image",
+    "tags",
+    "ingredients",
+)
+INGREDIENT_KEYS = ("name", "measurement_unit", "amount")
+
+
+def clean_fields(model, values):
+    """Проверяет ``values`` валидаторами полей модели.
+
+    Возвращает значения, приведённые к типам полей; бросает
+    ValidationError.
+    """
+    instance = model(**values)
+    instance.clean_fields(
+        exclude=[
+            field.name
+            for field in model._meta.fields
+            if field.name not in values
+        ],
+    )
+    return {name: getattr(instance, name) for name in values}
+
+
+class Command(BaseCommand):
+    help = (
+        "Загружает рецепты из JSON Lines в формате export_recipes; "
+        "недостающие ингредиенты создаются"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            nargs="?",
+            default="-",
+            help="Файл с рецептами; по умолчанию stdin",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Сколько рецептов загружать за транзакцию",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        self.imported = self.skipped = 0
+        started = time.monotonic()
+        if path == "-":
+            self._import(sys.stdin, options["batch_size"])
+        else:
+            with open(path, encoding="utf-8") as lines:
+                self._import(lines, options["batch_size"])
+        elapsed = time.monotonic() - started
+        # Новые ингредиенты: другие процессы заметят их по версии таблицы.
+        ingredient_index.invalidate()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Загружено рецептов: {self.imported}, пропущено: "
+                f"{self.skipped} за {elapsed:.2f} с "
+                f"({self.imported / max(elapsed, 1e-6):.0f} строк/с). "
+                "Уменьшенные копии изображений строит build_image_variants",
+            ),
+        )
+
+    def _import(self, lines, batch_size):
+        numbered = enumerate(lines, start=1)
+        while True:
+            batch = []
+            for number, line in islice(numbered, batch_size):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as error:
+                    raise CommandError(
+                        f"Строка {number}: {error}"
+                    ) from None
+                error = self._invalid(record)
+                if error:
+                    self.stderr.write(
+                        f"Строка {number}: {error}, пропущена"
+                    )
+                    self.skipped += 1
+                    continue
+                batch.append((number, record))
+            if not batch:
+                return
+            with transaction.atomic():
+                self._load_batch(batch)
+
+    def _load_batch(self, batch):
+        """Загружает пачку рецептов несколькими bulk_create.
+
+        Автор, теги и ингредиенты всей пачки разрешаются по одному запросу
+        на модель. Строки с неизвестным автором или тегом пропускаются.
+        """
+        authors = dict(
+            User.objects.filter(
+                email__in={record["author"] for _, record in batch},
+            ).values_list("email", "id"),
+        )
+        tags = dict(
+            Tag.objects.filter(
+                slug__in={
+                    slug for _, record in batch for slug in record["tags"]
+                },
+            ).values_list("slug", "id"),
+        )
+        ingredients = self._resolve_ingredients(
+            {
+                item["name"]: item["measurement_unit"]
+                for _, record in batch
+                for item in record["ingredients"]
+            },
+        )
+
+        recipes = []
+        for number, record in batch:
+            missing = [slug for slug in record["tags"] if slug not in tags]
+            if record["author"] not in authors or missing:
+                reason = (
+                    f"неизвестные теги {', '.join(missing)}"
+                    if missing
+                    else f"неизвестный автор {record['author']}"
+                )
+                self.stderr.write(f"Строка {number}: {reason}, пропущена")
+                self.skipped += 1
+                continue
+            recipe = Recipe(
+                author_id=authors[record["author"]],
+                name=record["name"],
+                text=record["text"],
+                cooking_time=record["cooking_time"],
+                image=self._image(number, record),
+            )
+            recipes.append((recipe, record))
+        if not recipes:
+            return
+
+        objects = [recipe for recipe, _ in recipes]
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(objects)
+            # bulk_create не порождает сигналов — счётчики авторов сами.
+            per_author = defaultdict(int)
+            for recipe in objects:
+                per_author[recipe.author_id] += 1
+            by_count = defaultdict(list)
+            for author_id, count in per_author.items():
+                by_count[count].append(author_id)
+            for count, author_ids in by_count.items():
+                counters.adjust_many(
+                    User, "recipes_count", author_ids, count
+                )
+        else:
+            # Без RETURNING у вставки id не узнать: сохраняем по одному,
+            # счётчики сдвигают сигналы.
+            for recipe in objects:
+                recipe.save()
+
+        Recipe.tags.through.objects.bulk_create(
+            [
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=tags[slug])
+                for recipe, record in recipes
+                for slug in set(record["tags"])
+            ],
+        )
+        IngredientInRecipe.objects.bulk_create(
+            [
+                IngredientInRecipe(
+                    recipe_id=recipe.pk,
+                    ingredient_id=ingredients[name],
+                    amount=amount,
+                )
+                for recipe, record in recipes
+                for name, amount in self._amounts(record).items()
+            ],
+        )
+        # Кэш представлений и поисковые векторы — как у правки через API
+        # (updated уже выставлен при вставке); сигнал уйдёт один раз после
+        # коммита пачки.
+        notify_recipes_changed(
+            [recipe.pk for recipe in objects],
+            touch=False,
+            reindex=True,
+        )
+        self.imported += len(objects)
+
+    @classmethod
+    def _invalid(cls, record):
+        """Причина пропустить запись или None.
+
+        Поля проверяются валидаторами моделей — теми же ограничениями,
+        что и при правке через API (время приготовления, количество).
+        """
+        if not isinstance(record, dict):
+            return "запись должна быть объектом"
+        missing = [key for key in RECORD_KEYS if key not in record]
+        if missing:
+            return f"нет полей {', '.join(missing)}"
+        tags, items = record["tags"], record["ingredients"]
+        if not isinstance(tags, list) or not isinstance(items, list):
+            return "tags и ingredients должны быть списками"
+        for item in items:
+            if not isinstance(item, dict) or any(
+                key not in item for key in INGREDIENT_KEYS
+            ):
+                return (
+                    "у ингредиента нужны поля "
+                    f"{', '.join(INGREDIENT_KEYS)}"
+                )
+        # Приведённые значения записываются обратно: "5" станет 5.
+        try:
+            record.update(
+                clean_fields(
+                    Recipe,
+                    {
+                        field: record[field]
+                        for field in ("name", "text", "cooking_time")
+                    },
+                ),
+            )
+            for item in items:
+                item.update(
+                    clean_fields(
+                        Ingredient,
+                        {
+                            "name": item["name"],
+                            "measurement_unit": item["measurement_unit"],
+                        },
+                    ),
+                    **clean_fields(
+                        IngredientInRecipe,
+                        {"amount": item["amount"]},
+                    ),
+                )
+            # Повторы ингредиента складываются — проверяем и сумму.
+            for amount in cls._amounts(record).values():
+                clean_fields(IngredientInRecipe, {"amount": amount})
+        except ValidationError as error:
+            return "; ".join(
+                f"{field}: {' '.join(messages)}"
+                for field, messages in error.message_dict.items()
+            )
+        return None
+
+    @staticmethod
+    def _amounts(record):
+        # Повторы ингредиента в рецепте складываются.
+        amounts = defaultdict(int)
+        for item in record["ingredients"]:
+            amounts[item["name"]] += item["amount"]
+        return amounts
+
+    @staticmethod
+    def _resolve_ingredients(units):
+        """Id ингредиентов по названиям; недостающие создаются."""
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=unit)
+                for name, unit in units.items()
+            ],
+            ignore_conflicts=True,
+        )
+        return dict(
+            Ingredient.objects.filter(name__in=units).values_list(
+                "name",
+                "id",
+            ),
+        )
+
+    def _image(self, number, record):
+        """Путь к изображению; image_data сохраняется в хранилище."""
+        if "image_data" not in record:
+            return record["image"]
+        try:
+            content = base64.b64decode(record["image_data"], validate=True)
+        except binascii.Error:
+            raise CommandError(
+                f"Строка {number}: некорректный image_data",
+            ) from None
+        name = posixpath.join(
+            Recipe._meta.get_field("image").upload_to,
+            posixpath.basename(record["image"] or "image.jpg"),
+        )
+        return default_storage.save(name, ContentFile(content))
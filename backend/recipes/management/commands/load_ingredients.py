@@ -1,38 +1,285 @@
+import csv
+import io
+from itertools import islice
 import json
 from pathlib import Path
+import time
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
 
-from recipes.models import Ingredient
+from recipes.models import Ingredient, IngredientInRecipe
+from recipes.search import ingredient_index
+from recipes.signals import notify_recipes_changed
+
+READ_CHUNK = 64 * 1024
+
+
+def read_json(file):
+    """Пары (название, единица) из JSON-массива объектов или JSON Lines.
+
+    Файл читается кусками и разбирается по одному объекту, так что
+    целиком в памяти он не оказывается.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    while True:
+        # Между объектами — скобки массива, запятые и пробелы.
+        while position < len(buffer) and buffer[position] in "[],\r\n\t ":
+            position += 1
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_CHUNK)
+            if not chunk:
+                if position < len(buffer):
+                    raise
+                return
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item["name"], item["measurement_unit"]
+
+
+def read_csv(file):
+    """Пары (название, единица) из CSV без заголовка."""
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1]
+
+
+READERS = {"json": read_json, "jsonl": read_json, "csv": read_csv}
+
+
+class CsvStream(io.TextIOBase):
+    """Файлоподобный поток строк CSV для COPY … FROM STDIN.
+
+    Строки формируются по мере того, как psycopg2 вычитывает поток.
+    """
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        for row in islice(self._rows, 1000):
+            self._writer.writerow(row)
+            if 0 < size <= self._buffer.tell():
+                break
+        return self._buffer.getvalue()
 
 
 class Command(BaseCommand):
-    help = "Загружает ингредиенты из файла data/ingredients.json"
+    help = (
+        "Загружает ингредиенты из JSON или CSV (по умолчанию "
+        "data/ingredients.json), добавляя новые и не трогая существующие"
+    )
 
-    def handle(self, *args, **kwargs):
-        data_file = Path(settings.BASE_DIR) / "data" / "ingredients.json"
-        if not data_file.exists():
-            self.stderr.write(
-                self.style.ERROR(f"Файл не найден: {data_file}"),
-            )
-            return
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            nargs="?",
+            default=Path(settings.BASE_DIR) / "data" / "ingredients.json",
+            type=Path,
+            help="Файл .json (массив или JSON Lines) или .csv",
+        )
+        parser.add_argument(
+            "--format",
+            choices=sorted(READERS),
+            help="Формат файла, если его не видно по расширению",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Сколько строк вставлять одним запросом",
+        )
+        parser.add_argument(
+            "--update",
+            action="store_true",
+            help="Обновлять единицу измерения у уже существующих",
+        )
+        parser.add_argument(
+            "--copy",
+            action="store_true",
+            help="Загрузить через COPY (только PostgreSQL)",
+        )
 
-        with data_file.open("r", encoding="utf-8") as f:
-            ingredients = json.load(f)
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not path.exists():
+            raise CommandError(f"Файл не найден: {path}")
+        file_format = options["format"] or path.suffix.lstrip(".").lower()
+        if file_format not in READERS:
+            raise CommandError(f"Неизвестный формат файла: {path.name}")
+        if options["copy"] and connection.vendor != "postgresql":
+            raise CommandError("--copy доступен только для PostgreSQL")
+        self.update = options["update"]
+        self.created = self.updated = 0
 
-        created_count = 0
-        for item in ingredients:
-            name = item["name"].strip()
-            unit = item["measurement_unit"].strip()
-            _, created = Ingredient.objects.get_or_create(
-                name=name,
-                measurement_unit=unit,
-            )
-            if created:
-                created_count += 1
+        started = time.monotonic()
+        with path.open(encoding="utf-8", newline="") as file:
+            rows = self._clean(READERS[file_format](file))
+            if options["copy"]:
+                total = self._copy(rows)
+            else:
+                total = 0
+                while True:
+                    batch = dict(islice(rows, options["batch_size"]))
+                    if not batch:
+                        break
+                    total += len(batch)
+                    with transaction.atomic():
+                        self._load_batch(batch)
+        elapsed = time.monotonic() - started
+        # Остальные процессы увидят правку по версии таблицы.
+        ingredient_index.invalidate()
 
         self.stdout.write(
             self.style.SUCCESS(
-                f"Успешно загружено {created_count} ингредиентов",
+                f"Обработано строк: {total}, добавлено: {self.created}, "
+                f"обновлено: {self.updated} за {elapsed:.2f} с "
+                f"({total / max(elapsed, 1e-6):.0f} строк/с)",
             ),
         )
+
+    @staticmethod
+    def _clean(rows):
+        for name, unit in rows:
+            name = name.strip()
+            if name:
+                yield name, unit.strip()
+
+    def _load_batch(self, batch):
+        """Вставляет пачку {название: единица}; повторы уже схлопнуты."""
+        if connection.vendor == "postgresql":
+            self._upsert(batch)
+            return
+        existing = {
+            name: (pk, unit)
+            for pk, name, unit in Ingredient.objects.filter(
+                name__in=batch,
+            ).values_list("id", "name", "measurement_unit")
+        }
+        now = timezone.now()
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=unit)
+                for name, unit in batch.items()
+                if name not in existing
+            ],
+            ignore_conflicts=True,
+        )
+        self.created += len(batch) - len(existing)
+        if not self.update:
+            return
+        changed = [
+            Ingredient(pk=pk, measurement_unit=batch[name], updated=now)
+            for name, (pk, unit) in existing.items()
+            if unit != batch[name]
+        ]
+        Ingredient.objects.bulk_update(
+            changed,
+            ["measurement_unit", "updated"],
+        )
+        self._changed([ingredient.pk for ingredient in changed])
+
+    def _conflict_clause(self):
+        if not self.update:
+            return "DO NOTHING"
+        # updated выставляем сами: auto_now работает только через ORM.
+        return (
+            "DO UPDATE SET measurement_unit = EXCLUDED.measurement_unit, "
+            "updated = EXCLUDED.updated "
+            f"WHERE {self.table}.measurement_unit "
+            "IS DISTINCT FROM EXCLUDED.measurement_unit"
+        )
+
+    @property
+    def table(self):
+        return connection.ops.quote_name(Ingredient._meta.db_table)
+
+    def _upsert(self, batch):
+        """INSERT … ON CONFLICT одним запросом на пачку.
+
+        В Django 3.2 у bulk_create нет update_conflicts, поэтому запрос
+        собирается вручную. xmax <> 0 отличает обновлённые строки от
+        вставленных.
+        """
+        now = timezone.now()
+        values = ", ".join(["(%s, %s, %s)"] * len(batch))
+        params = [
+            value
+            for name, unit in batch.items()
+            for value in (name, unit, now)
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {self.table} "
+                "(name, measurement_unit, updated) "
+                f"VALUES {values} "
+                f"ON CONFLICT (name) {self._conflict_clause()} "
+                "RETURNING id, xmax <> 0",
+                params,
+            )
+            results = cursor.fetchall()
+        changed = [pk for pk, updated in results if updated]
+        self.created += len(results) - len(changed)
+        self._changed(changed)
+
+    def _copy(self, rows):
+        """Загрузка через COPY во временную таблицу и один INSERT из неё.
+
+        Повторы названий схлопываются в пользу последней строки файла.
+        Возвращает число прочитанных строк.
+        """
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMPORARY TABLE ingredient_load ("
+                "position bigserial, name text, measurement_unit text"
+                ") ON COMMIT DROP",
+            )
+            cursor.copy_expert(
+                "COPY ingredient_load (name, measurement_unit) "
+                "FROM STDIN WITH (FORMAT csv)",
+                CsvStream(rows),
+            )
+            cursor.execute(
+                "WITH loaded AS ("
+                f"INSERT INTO {self.table} "
+                "(name, measurement_unit, updated) "
+                "SELECT DISTINCT ON (name) name, measurement_unit, %s "
+                "FROM ingredient_load ORDER BY name, position DESC "
+                f"ON CONFLICT (name) {self._conflict_clause()} "
+                "RETURNING id, xmax <> 0 AS updated"
+                ") SELECT "
+                "(SELECT count(*) FROM ingredient_load), "
+                "count(*) FILTER (WHERE NOT updated), "
+                "array_agg(id) FILTER (WHERE updated) "
+                "FROM loaded",
+                [timezone.now()],
+            )
+            total, self.created, changed = cursor.fetchone()
+            self._changed(changed or [])
+        return total
+
+    def _changed(self, ingredient_ids):
+        # Единица измерения входит в кэшированные представления рецептов.
+        if not ingredient_ids:
+            return
+        self.updated += len(ingredient_ids)
+        notify_recipes_changed(
+            IngredientInRecipe.objects.filter(
+                ingredient_id__in=ingredient_ids,
+            )
+            .values_list("recipe_id", flat=True)
+            .distinct(),
+        )
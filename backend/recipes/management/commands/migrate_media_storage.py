@@ -0,0 +1,157 @@
+import os
+import shutil
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from foodgram.storage import (
+    ContentAddressedStorage,
+    file_digest,
+    hashed_name,
+    is_hashed_name,
+)
+from recipes.cache import invalidate_representations
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит медиафайлы под имена по хэшу содержимого "
+        "и переписывает пути в базе"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Сколько строк переписывать за транзакцию",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только посчитать файлы, ничего не меняя",
+        )
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError(
+                "DEFAULT_FILE_STORAGE должен быть "
+                "foodgram.storage.ContentAddressedStorage",
+            )
+        self.dry_run = options["dry_run"]
+        # старое имя -> новое; старые файлы удаляются после коммита пачки
+        self.moved = {}
+        self.stale = []
+        self.stats = {"moved": 0, "deduplicated": 0, "missing": 0}
+        batch_size = options["batch_size"]
+
+        recipes = Recipe.objects.exclude(image="").values_list(
+            "pk",
+            "image",
+            "image_variants",
+        )
+        self._migrate(
+            Recipe,
+            recipes.iterator(chunk_size=batch_size),
+            batch_size,
+            self._recipe_fields,
+        )
+        users = User.objects.exclude(avatar="").values_list("pk", "avatar")
+        self._migrate(
+            User,
+            users.iterator(chunk_size=batch_size),
+            batch_size,
+            self._user_fields,
+        )
+
+        message = (
+            "Перенесено файлов: {moved}, совпали с уже сохранёнными: "
+            "{deduplicated}, не найдено: {missing}"
+        ).format(**self.stats)
+        self.stdout.write(self.style.SUCCESS(message))
+
+    def _recipe_fields(self, row):
+        _, image, variants = row
+        return {
+            "image": self._relocate(image),
+            "image_variants": {
+                key: self._relocate(name) for key, name in variants.items()
+            },
+        }
+
+    def _user_fields(self, row):
+        return {"avatar": self._relocate(row[1])}
+
+    def _migrate(self, model, rows, batch_size, get_fields):
+        batch = []
+        for row in rows:
+            batch.append((row[0], get_fields(row)))
+            if len(batch) == batch_size:
+                self._flush(model, batch)
+                batch = []
+        if batch:
+            self._flush(model, batch)
+
+    def _flush(self, model, batch):
+        """Переписывает пути пачки одним bulk_update и удаляет старые файлы.
+
+        Новые файлы к этому моменту уже созданы (жёсткой ссылкой или
+        копией), а старые удаляются только после коммита, так что сбой на
+        любом шаге не оставляет в базе ссылок на несуществующие файлы.
+        """
+        if self.dry_run:
+            return
+        pks = [pk for pk, _ in batch]
+        objects = [model(pk=pk, **fields) for pk, fields in batch]
+        # Пути изменились: сдвигаем updated и сбрасываем кэш представлений
+        # затронутых рецептов (аватар автора входит в представление).
+        if model is Recipe:
+            recipes = Recipe.objects.filter(pk__in=pks)
+        else:
+            recipes = Recipe.objects.filter(author_id__in=pks)
+        with transaction.atomic():
+            model.objects.bulk_update(objects, list(batch[0][1]))
+            invalidate_representations(
+                list(recipes.values_list("pk", flat=True)),
+            )
+            recipes.update(updated=timezone.now())
+        for name in self.stale:
+            default_storage.delete(name)
+        self.stale = []
+
+    def _relocate(self, name):
+        """Новое имя файла ``name``; сам файл связывается с новым путём.
+
+        Уже перенесённые и отсутствующие файлы возвращаются как есть.
+        """
+        if not name or is_hashed_name(name):
+            return name
+        if name in self.moved:
+            return self.moved[name]
+        if not default_storage.exists(name):
+            self.stats["missing"] += 1
+            return name
+        with default_storage.open(name) as file:
+            new_name = hashed_name(name, file_digest(file))
+        if default_storage.exists(new_name):
+            self.stats["deduplicated"] += 1
+        else:
+            self.stats["moved"] += 1
+            if not self.dry_run:
+                self._link(name, new_name)
+        self.moved[name] = new_name
+        self.stale.append(name)
+        return new_name
+
+    @staticmethod
+    def _link(name, new_name):
+        source = default_storage.path(name)
+        target = default_storage.path(new_name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
@@ -0,0 +1,46 @@
+from itertools import islice
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from recipes import shopping_list
+from recipes.models import ShoppingCart, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает материализованные списки покупок с нуля"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Сколько пользователей пересчитывать за транзакцию",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        # Строки пользователей с пустой корзиной остаться не должны.
+        ShoppingListItem.objects.filter(
+            ~Exists(
+                ShoppingCart.objects.filter(user_id=OuterRef("user_id"))
+            ),
+        ).delete()
+        user_ids = (
+            ShoppingCart.objects.order_by("user_id")
+            .values_list("user_id", flat=True)
+            .distinct()
+            .iterator()
+        )
+        rebuilt = 0
+        while True:
+            batch = list(islice(user_ids, batch_size))
+            if not batch:
+                break
+            shopping_list.rebuild(batch)
+            rebuilt += len(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Пересчитаны списки покупок {rebuilt} пользователей",
+            ),
+        )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recipes import counters
+
+
+class Command(BaseCommand):
+    help = "Сверяет денормализованные счётчики с фактическими данными"
+
+    def handle(self, *args, **options):
+        for (model, field), fixed in counters.reconcile().items():
+            self.stdout.write(
+                f"{model._meta.label}.{field}: исправлено строк — {fixed}",
+            )
+        self.stdout.write(self.style.SUCCESS("Счётчики сверены"))
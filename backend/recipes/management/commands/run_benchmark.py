@@ -0,0 +1,193 @@
+import json
+from pathlib import Path
+import statistics
+import time
+import tracemalloc
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from rest_framework.authtoken.models import Token
+from recipes.management.commands.seed_benchmark import benchmark_users
+from recipes.models import Recipe
+
+# (имя «basename.action», URL, нужен ли вход). В URL подставляются
+# {recipe} — самый популярный рецепт набора.
+SCENARIOS = (
+    ("recipes.list", "/api/recipes/", False),
+    ("recipes.list_popular", "/api/recipes/?ordering=popular", False),
+    (
+        "recipes.list_cursor",
+        "/api/recipes/?pagination=cursor&limit=20",
+        False,
+    ),
+    ("recipes.list_favorited", "/api/recipes/?is_favorited=1", True),
+    ("recipes.retrieve", "/api/recipes/{recipe}/", True),
+    (
+        "users.subscriptions",
+        "/api/users/subscriptions/?recipes_limit=3",
+        True,
+    ),
+    (
+        "recipes.download_shopping_cart",
+        "/api/recipes/download_shopping_cart/",
+        True,
+    ),
+    ("ingredients.list", "/api/ingredients/?name=б", False),
+)
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / "benchmarks" / "baseline.json"
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет эндпоинты API на наборе seed_benchmark: задержку p50/p95, "
+        "число запросов к БД и пик памяти; сверяет с сохранённой базой"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "scenarios",
+            nargs="*",
+            help="Имена сценариев; по умолчанию все",
+        )
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument(
+            "--baseline",
+            type=Path,
+            default=DEFAULT_BASELINE,
+            help="JSON с базовыми результатами",
+        )
+        parser.add_argument(
+            "--save-baseline",
+            action="store_true",
+            help="Записать результаты как новую базу",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.25,
+            help="Допустимый рост p95 и памяти относительно базы (доля)",
+        )
+
+    def handle(self, *args, **options):
+        scenarios = [
+            scenario
+            for scenario in SCENARIOS
+            if not options["scenarios"]
+            or scenario[0] in options["scenarios"]
+        ]
+        if not scenarios:
+            raise CommandError("Нет таких сценариев")
+        user = benchmark_users().order_by("pk").first()
+        recipe = (
+            Recipe.objects.filter(author__in=benchmark_users())
+            .order_by("-favorites_count", "pk")
+            .first()
+        )
+        if user is None or recipe is None:
+            raise CommandError(
+                "Нет данных: сначала запустите seed_benchmark"
+            )
+        token, _ = Token.objects.get_or_create(user=user)
+        clients = {
+            False: Client(),
+            True: Client(HTTP_AUTHORIZATION=f"Token {token.key}"),
+        }
+
+        results = {}
+        # Замер foodgram.middleware выключен, чтобы не искажать времена.
+        with override_settings(
+            ALLOWED_HOSTS=["testserver"],
+            REQUEST_TIMING_SAMPLE_RATE=0,
+        ):
+            for name, url, authenticated in scenarios:
+                results[name] = self._measure(
+                    clients[authenticated],
+                    url.format(recipe=recipe.pk),
+                    options["iterations"],
+                    options["warmup"],
+                )
+                self._report(name, results[name])
+
+        if options["save_baseline"]:
+            options["baseline"].parent.mkdir(parents=True, exist_ok=True)
+            options["baseline"].write_text(
+                json.dumps(results, indent=2, sort_keys=True),
+            )
+            self.stdout.write(f"База сохранена: {options['baseline']}")
+            return
+        if options["baseline"].exists():
+            self._compare(
+                results, options["baseline"], options["tolerance"]
+            )
+
+    def _measure(self, client, url, iterations, warmup):
+        # Прогрев заполняет кэши и соединение с БД.
+        for _ in range(warmup):
+            self._get(client, url)
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            self._get(client, url)
+            timings.append((time.perf_counter() - started) * 1000)
+        # Запросы и память — отдельным прогоном, чтобы учёт не искажал
+        # замер времени.
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            self._get(client, url)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        cuts = statistics.quantiles(timings, n=100, method="inclusive")
+        return {
+            "p50_ms": round(cuts[49], 2),
+            "p95_ms": round(cuts[94], 2),
+            "queries": len(queries),
+            "peak_kb": round(peak / 1024, 1),
+        }
+
+    @staticmethod
+    def _get(client, url):
+        response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f"{url}: ответ {response.status_code}")
+
+    def _report(self, name, result):
+        self.stdout.write(
+            f"{name:34} p50 {result['p50_ms']:8.2f} мс  "
+            f"p95 {result['p95_ms']:8.2f} мс  "
+            f"запросов {result['queries']:3}  "
+            f"пик {result['peak_kb']:9.1f} КБ",
+        )
+
+    def _compare(self, results, path, tolerance):
+        """Сравнивает с базой; при регрессии команда завершается ошибкой.
+
+        Число запросов не должно расти вовсе, p95 и пик памяти — больше
+        чем на ``tolerance``.
+        """
+        baseline = json.loads(path.read_text())
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if result["queries"] > base["queries"]:
+                regressions.append(
+                    f"{name}: запросов {result['queries']} "
+                    f"вместо {base['queries']}",
+                )
+            for metric in ("p95_ms", "peak_kb"):
+                if result[metric] > base[metric] * (1 + tolerance):
+                    regressions.append(
+                        f"{name}: {metric} {result[metric]} "
+                        f"против {base[metric]}",
+                    )
+        if regressions:
+            raise CommandError(
+                "Регрессия относительно базы:\n" + "\n".join(regressions),
+            )
+        self.stdout.write(self.style.SUCCESS("Регрессий нет"))
@@ -0,0 +1,336 @@
+from io import BytesIO
+from itertools import islice
+import random
+import time
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from recipes import counters, images, shopping_list
+from recipes.cache import invalidate_representations
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+)
+from recipes.search import refresh_search_vectors
+from users.authentication import token_cache
+from users.models import Subscription, User
+
+# Почтовый домен синтетических пользователей: по нему набор и удаляется.
+BENCHMARK_DOMAIN = "benchmark.foodgram.local"
+BENCHMARK_PASSWORD = "benchmark-password"
+
+
+def benchmark_users():
+    return User.objects.filter(email__endswith=f"@{BENCHMARK_DOMAIN}")
+
+
+def delete_rows(queryset):
+    """Удаляет строки выборки одним DELETE … WHERE id IN (SELECT …).
+
+    В обход QuerySet.delete: тот загружает каждую строку ради каскада и
+    сигналов pre/post_delete, а обработчики сдвигали бы счётчики и списки
+    покупок построчно — _clear пересчитывает их один раз в конце.
+    """
+    model = queryset.model
+    quote = connection.ops.quote_name
+    sql, params = queryset.order_by().values("pk").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {quote(model._meta.db_table)} "
+            f"WHERE {quote(model._meta.pk.column)} IN ({sql})",
+            params,
+        )
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Создаёт воспроизводимый синтетический набор данных для "
+        "нагрузочных замеров (run_benchmark); прежний набор удаляется"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--recipes", type=int, default=2000)
+        parser.add_argument(
+            "--ingredients-per-recipe",
+            type=int,
+            default=8,
+        )
+        parser.add_argument(
+            "--favorites",
+            type=int,
+            default=20,
+            help="Избранных рецептов у каждого пользователя",
+        )
+        parser.add_argument(
+            "--carts",
+            type=int,
+            default=5,
+            help="Рецептов в корзине у каждого пользователя",
+        )
+        parser.add_argument(
+            "--subscriptions",
+            type=int,
+            default=10,
+            help="Подписок у каждого пользователя",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Зерно генератора: один и тот же набор при равных зёрнах",
+        )
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Только удалить набор",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        self.batch_size = options["batch_size"]
+        self.random = random.Random(options["seed"])
+        self._clear()
+        if options["clear"]:
+            self.stdout.write(self.style.SUCCESS("Набор удалён"))
+            return
+
+        user_ids = self._create_users(options["users"])
+        recipe_ids = self._create_recipes(
+            user_ids,
+            options["recipes"],
+            options["ingredients_per_recipe"],
+        )
+        for model, per_user in (
+            (Favorite, options["favorites"]),
+            (ShoppingCart, options["carts"]),
+        ):
+            self._create_relations(
+                model,
+                user_ids,
+                recipe_ids,
+                per_user,
+                "recipe_id",
+            )
+        self._create_relations(
+            Subscription,
+            user_ids,
+            user_ids,
+            options["subscriptions"],
+            "following_id",
+        )
+        self._finish(user_ids, recipe_ids)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Создано пользователей: {len(user_ids)}, рецептов: "
+                f"{len(recipe_ids)} за {time.monotonic() - started:.1f} с; "
+                f"пароль пользователей — {BENCHMARK_PASSWORD}",
+            ),
+        )
+
+    def _clear(self):
+        """Удаляет прежний набор без сигналов на каждую строку.
+
+        Счётчики и списки покупок остальных пользователей, задетые
+        удалением, пересчитываются в конце.
+        """
+        users = benchmark_users()
+        recipes = Recipe.objects.filter(author__in=users)
+        affected = list(
+            ShoppingCart.objects.filter(recipe__in=recipes)
+            .exclude(user__in=users)
+            .values_list("user_id", flat=True)
+            .distinct(),
+        )
+        # Записи удаляемых рецептов больше не понадобятся.
+        for batch in batched(
+            recipes.order_by("pk").values_list("pk", flat=True).iterator(),
+            self.batch_size,
+        ):
+            invalidate_representations(batch)
+        # Токены удаляются в обход сигналов — и их записи в кэше входа.
+        token_cache.invalidate(
+            Token.objects.filter(user__in=users).values_list(
+                "key",
+                flat=True,
+            ),
+        )
+        with transaction.atomic():
+            for queryset in (
+                Favorite.objects.filter(user__in=users),
+                Favorite.objects.filter(recipe__in=recipes),
+                ShoppingCart.objects.filter(user__in=users),
+                ShoppingCart.objects.filter(recipe__in=recipes),
+                ShoppingListItem.objects.filter(user__in=users),
+                Subscription.objects.filter(user__in=users),
+                Subscription.objects.filter(following__in=users),
+                IngredientInRecipe.objects.filter(recipe__in=recipes),
+                Recipe.tags.through.objects.filter(recipe__in=recipes),
+                recipes,
+                Token.objects.filter(user__in=users),
+                users,
+            ):
+                delete_rows(queryset)
+            counters.reconcile()
+            if affected:
+                shopping_list.rebuild(affected)
+
+    def _create_users(self, count):
+        password = make_password(BENCHMARK_PASSWORD)
+        for batch in batched(range(count), self.batch_size):
+            User.objects.bulk_create(
+                [
+                    User(
+                        email=f"user{index}@{BENCHMARK_DOMAIN}",
+                        username=f"benchmark{index}",
+                        first_name="Бенчмарк",
+                        last_name=str(index),
+                        password=password,
+                    )
+                    for index in batch
+                ],
+            )
+        return list(
+            benchmark_users().order_by("pk").values_list("pk", flat=True),
+        )
+
+    def _catalogue(self, model, minimum, build):
+        """Id справочника; если в нём мало записей, добавляются свои."""
+        ids = list(
+            model.objects.order_by("pk").values_list("pk", flat=True)
+        )
+        if len(ids) < minimum:
+            model.objects.bulk_create(
+                [build(index) for index in range(minimum - len(ids))],
+                ignore_conflicts=True,
+            )
+            ids = list(
+                model.objects.order_by("pk").values_list("pk", flat=True),
+            )
+        return ids
+
+    def _image(self):
+        """Одно изображение с готовыми вариантами на все рецепты набора."""
+        buffer = BytesIO()
+        Image.new("RGB", (1200, 800), (200, 120, 60)).save(buffer, "JPEG")
+        name = default_storage.save(
+            "recipes/images/benchmark.jpg",
+            ContentFile(buffer.getvalue()),
+        )
+        return name, images.build_variants(name)
+
+    def _create_recipes(self, user_ids, count, per_recipe):
+        tag_ids = self._catalogue(
+            Tag,
+            3,
+            lambda index: Tag(
+                name=f"Бенчмарк {index}",
+                slug=f"benchmark-{index}",
+                color="#808080",
+            ),
+        )
+        ingredient_ids = self._catalogue(
+            Ingredient,
+            per_recipe * 10,
+            lambda index: Ingredient(
+                name=f"бенчмарк-ингредиент {index}",
+                measurement_unit="г",
+            ),
+        )
+        image, variants = self._image()
+        recipe_ids = []
+        for batch in batched(range(count), self.batch_size):
+            names = [f"Бенчмарк {index}" for index in batch]
+            with transaction.atomic():
+                Recipe.objects.bulk_create(
+                    [
+                        Recipe(
+                            author_id=self.random.choice(user_ids),
+                            name=name,
+                            text=f"{name}: описание приготовления. " * 5,
+                            cooking_time=self.random.randint(1, 180),
+                            image=image,
+                            image_variants=variants,
+                        )
+                        for name in names
+                    ],
+                )
+                # id берутся запросом: SQLite не возвращает их из вставки.
+                # Порядок — по pk, как у остальных выборок: от него зависят
+                # случайные ингредиенты и теги, а набор должен повторяться.
+                ids = list(
+                    Recipe.objects.filter(
+                        name__in=names,
+                        author_id__in=user_ids,
+                    )
+                    .order_by("pk")
+                    .values_list("pk", flat=True),
+                )
+                IngredientInRecipe.objects.bulk_create(
+                    [
+                        IngredientInRecipe(
+                            recipe_id=recipe_id,
+                            ingredient_id=ingredient_id,
+                            amount=self.random.randint(1, 500),
+                        )
+                        for recipe_id in ids
+                        for ingredient_id in self.random.sample(
+                            ingredient_ids,
+                            min(per_recipe, len(ingredient_ids)),
+                        )
+                    ],
+                )
+                Recipe.tags.through.objects.bulk_create(
+                    [
+                        Recipe.tags.through(recipe_id=recipe_id, tag_id=tag)
+                        for recipe_id in ids
+                        for tag in self.random.sample(
+                            tag_ids,
+                            self.random.randint(1, min(3, len(tag_ids))),
+                        )
+                    ],
+                )
+            recipe_ids.extend(ids)
+        return recipe_ids
+
+    def _create_relations(self, model, user_ids, target_ids, per_user, key):
+        rows = (
+            model(user_id=user_id, **{key: target_id})
+            for user_id in user_ids
+            for target_id in self.random.sample(
+                target_ids,
+                min(per_user, len(target_ids)),
+            )
+            if target_id != user_id or model is not Subscription
+        )
+        for batch in batched(rows, self.batch_size):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+
+    def _finish(self, user_ids, recipe_ids):
+        # Вставки шли в обход сигналов: досчитываем производные данные.
+        counters.reconcile()
+        for batch in batched(user_ids, self.batch_size):
+            shopping_list.rebuild(batch)
+        for batch in batched(recipe_ids, self.batch_size):
+            refresh_search_vectors(batch)
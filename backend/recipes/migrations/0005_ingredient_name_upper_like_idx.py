@@ -0,0 +1,34 @@
+# Generated by Django 3.2.3 on 2026-10-18 09:40
+
+from django.db import migrations
+
+INDEX_NAME = "ingredient_name_upper_like_idx"
+
+
+def create_index(apps, schema_editor):
+    # istartswith в PostgreSQL превращается в UPPER(name::text) LIKE …;
+    # text_pattern_ops позволяет использовать для него b-tree индекс
+    # при любой локали базы.
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} "
+        "ON recipes_ingredient (UPPER(name::text) text_pattern_ops)",
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0004_updated_stamps"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
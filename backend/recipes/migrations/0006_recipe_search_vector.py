@@ -0,0 +1,54 @@
+# Generated by Django 3.2.3 on 2026-10-18 06:10
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+INDEX_NAME = "recipe_search_vector_idx"
+
+
+def index_and_fill(apps, schema_editor):
+    # GIN-индекс и первичное заполнение — только для PostgreSQL; дальше
+    # вектор поддерживает recipes.search.refresh_search_vectors.
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} "
+        "ON recipes_recipe USING gin (search_vector)",
+    )
+    schema_editor.execute(
+        """
+        UPDATE recipes_recipe AS r SET search_vector =
+            setweight(to_tsvector('russian', COALESCE(r.name, '')), 'A')
+            || setweight(to_tsvector('russian', COALESCE((
+                SELECT string_agg(i.name, ' ')
+                FROM recipes_ingredientinrecipe AS l
+                JOIN recipes_ingredient AS i ON i.id = l.ingredient_id
+                WHERE l.recipe_id = r.id
+            ), '')), 'B')
+            || setweight(to_tsvector('russian', COALESCE(r.text, '')), 'C')
+        """,
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0005_ingredient_name_upper_like_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True, verbose_name="Поисковый вектор"
+            ),
+        ),
+        migrations.RunPython(index_and_fill, drop_index),
+    ]
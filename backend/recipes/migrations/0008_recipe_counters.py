@@ -0,0 +1,59 @@
+# Generated by Django 3.2.3 on 2026-10-18 06:15
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Favorite = apps.get_model("recipes", "Favorite")
+    Recipe = apps.get_model("recipes", "Recipe")
+    ShoppingCart = apps.get_model("recipes", "ShoppingCart")
+    User = apps.get_model("users", "User")
+    for model, field, source, key in (
+        (Recipe, "favorites_count", Favorite, "recipe"),
+        (Recipe, "in_carts_count", ShoppingCart, "recipe"),
+        (User, "recipes_count", Recipe, "author"),
+    ):
+        counts = (
+            source.objects.filter(**{key: models.OuterRef("pk")})
+            .order_by()
+            .values(key)
+            .annotate(count=models.Count("pk"))
+            .values("count")
+        )
+        model.objects.update(
+            **{field: Coalesce(models.Subquery(counts), 0)},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_shoppinglistitem'),
+        ('users', '0002_user_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name='В избранном'
+            ),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name='В корзинах'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(
+                fields=['-favorites_count', '-created', '-id'],
+                name='recipe_popular_idx',
+            ),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,97 @@
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models.functions import RowNumber
+
+
+class CountersMixin:
+    """Не даёт обычному save() затереть денормализованные счётчики.
+
+    Поля из ``counter_fields`` меняются только UPDATE с F-выражениями
+    (recipes.counters), а значение в памяти может отставать от базы,
+    поэтому при сохранении существующей строки они не записываются.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            skipped = self.get_deferred_fields().union(self.counter_fields)
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
+
+
+class RecipeQuerySet(models.QuerySet):
+    def with_user_flags(self, user):
+        """Аннотирует is_favorited / is_in_shopping_cart для пользователя.
+
+        Флаги считаются подзапросами EXISTS в основном запросе, поэтому
+        страница рецептов не порождает отдельных запросов на каждую строку.
+        """
+        if user is None or user.is_anonymous:
+            false = models.Value(False, output_field=models.BooleanField())
+            return self.annotate(
+                is_favorited=false,
+                is_in_shopping_cart=false,
+            )
+        return self.annotate(
+            is_favorited=models.Exists(
+                Favorite.objects.filter(
+                    user=user,
+                    recipe=models.OuterRef("pk"),
+                ),
+            ),
+            is_in_shopping_cart=models.Exists(
+                ShoppingCart.objects.filter(
+                    user=user,
+                    recipe=models.OuterRef("pk"),
+                ),
+            ),
+        )
+
+    def latest_by_author(self, author_ids, limit):
+        """Последние ``limit`` рецептов каждого из авторов одним запросом.
+
+        Рецепты нумеруются окном ROW_NUMBER() в разрезе автора, а отбор
+        первых строк делается во внешнем запросе: Django 3.2 не умеет
+        фильтровать по оконным функциям.
+        """
+        if not author_ids or limit <= 0:
+            return []
+        ranked = (
+            self.filter(author_id__in=author_ids)
+            .annotate(
+                preview_rank=models.Window(
+                    expression=RowNumber(),
+                    partition_by=[models.F("author_id")],
+                    order_by=[
+                        models.F("created").desc(),
+                        models.F("id").desc(),
+                    ],
+                ),
+            )
+            .order_by()
+            .values(
+                "id",
+                "author_id",
+                "name",
+                "image",
+                "image_variants",
+                "cooking_time",
+                "preview_rank",
+            )
+        )
+        sql, params = ranked.query.sql_with_params()
+        return self.model.objects.raw(
+            f"SELECT * FROM ({sql}) AS ranked "
+            "WHERE preview_rank <= %s ORDER BY author_id, preview_rank",
+            (*params, limit),
+        )
 
 
 class Tag(models.Model):
@@ -11,6 +102,10 @@ class Tag(models.Model):
     )
     color = models.CharField(max_length=7, verbose_name="Цвет (HEX)")
     slug = models.SlugField(unique=True, verbose_name="Слаг")
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Дата изменения",
+    )
 
     class Meta:
         verbose_name = "Тег"
@@ -31,6 +126,10 @@ class Ingredient(models.Model):
         max_length=200,
         verbose_name="Единица измерения",
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Дата изменения",
+    )
 
     class Meta:
         verbose_name = "Ингредиент"
@@ -41,7 +140,7 @@ class Ingredient(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(CountersMixin, models.Model):
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -53,6 +152,13 @@ class Recipe(models.Model):
         upload_to="recipes/images/",
         verbose_name="Изображение",
     )
+    # Уменьшенные копии image, которые строит recipes.images в фоне:
+    # {"source": имя исходного файла, "thumb" | "card" | "full": путь}.
+    image_variants = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name="Варианты изображения",
+    )
     text = models.TextField(verbose_name="Описание")
     cooking_time = models.PositiveSmallIntegerField(
         validators=[
@@ -65,6 +171,28 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name="Дата создания",
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Дата изменения",
+    )
+    # Счётчики поддерживаются recipes.counters в той же транзакции, что и
+    # запись связи; расхождения чинит команда reconcile_counters.
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="В избранном",
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="В корзинах",
+    )
+    # Поддерживается recipes.search.refresh_search_vectors (только PostgreSQL).
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name="Поисковый вектор",
+    )
     tags = models.ManyToManyField(
         Tag,
         related_name="recipes",
@@ -77,10 +205,23 @@ class Recipe(models.Model):
         verbose_name="Ингредиенты",
     )
 
+    objects = RecipeQuerySet.as_manager()
+    counter_fields = ("favorites_count", "in_carts_count")
+
     class Meta:
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
-        ordering = ["-created"]
+        ordering = ["-created", "-id"]
+        indexes = [
+            models.Index(
+                fields=["-created", "-id"],
+                name="recipe_created_id_idx",
+            ),
+            models.Index(
+                fields=["-favorites_count", "-created", "-id"],
+                name="recipe_popular_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -154,3 +295,42 @@ class ShoppingCart(RecipeRelation):
 
     def __str__(self):
         return f"{self.user} → корзина → {self.recipe}"
+
+
+class ShoppingListItem(models.Model):
+    """Итог по ингредиенту в корзине пользователя.
+
+    Материализованный список покупок: поддерживается инкрементально
+    (recipes.shopping_list) при изменении корзины и рецептов в ней,
+    поэтому выгрузка читает готовые строки без агрегации.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="shopping_list_items",
+        verbose_name="Пользователь",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="shopping_list_items",
+        verbose_name="Ингредиент",
+    )
+    total = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Количество",
+    )
+
+    class Meta:
+        verbose_name = "Позиция списка покупок"
+        verbose_name_plural = "Списки покупок"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ingredient"],
+                name="unique_shopping_list_item",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user}: {self.ingredient} — {self.total}"
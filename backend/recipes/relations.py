@@ -0,0 +1,272 @@
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Exists, OuterRef
+
+from recipes import counters, shopping_list
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription
+
+# Флаг зрителя в представлении рецепта для каждой связи.
+RELATION_FLAGS = {
+    Favorite: "is_favorited",
+    ShoppingCart: "is_in_shopping_cart",
+}
+
+# Результаты по каждому id в массовых операциях.
+ADDED = "added"
+REMOVED = "removed"
+ALREADY_ADDED = "already_added"
+NOT_ADDED = "not_added"
+NOT_FOUND = "not_found"
+
+
+def table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def column(model, name):
+    """Столбец поля модели для SQL в обход ORM, в кавычках СУБД."""
+    return connection.ops.quote_name(model._meta.get_field(name).column)
+
+
+def _resolve(model, user, recipe_ids):
+    """Существующие рецепты из ``recipe_ids`` и связи с ними — один запрос.
+
+    Возвращает {id рецепта: есть ли уже связь пользователя}.
+    """
+    return dict(
+        Recipe.objects.filter(pk__in=recipe_ids)
+        .annotate(
+            linked=Exists(
+                model.objects.filter(user=user, recipe=OuterRef("pk")),
+            ),
+        )
+        .values_list("pk", "linked"),
+    )
+
+
+def _results(recipe_ids, linked, if_linked, if_not_linked):
+    return {
+        pk: (
+            (if_linked if linked[pk] else if_not_linked)
+            if pk in linked
+            else NOT_FOUND
+        )
+        for pk in recipe_ids
+    }
+
+
+def add(model, user, recipe_ids):
+    """Добавляет рецепты в избранное или корзину (Favorite, ShoppingCart).
+
+    Связи вставляются одним запросом в обход сигналов, поэтому счётчики
+    и список покупок поддерживаются здесь явно — только для реально
+    вставленных строк. Возвращает {id рецепта: результат} в порядке
+    ``recipe_ids``.
+    """
+    linked = _resolve(model, user, recipe_ids)
+    new = [pk for pk, exists in linked.items() if not exists]
+    if new:
+        with transaction.atomic():
+            inserted = _insert(model, user, new)
+            if inserted:
+                counters.adjust_many(
+                    Recipe,
+                    counters.RELATION_COUNTERS[model],
+                    inserted,
+                    1,
+                )
+                if model is ShoppingCart:
+                    shopping_list.add_recipes(user.pk, inserted)
+        # Связь, вставленная параллельно после _resolve, уже была.
+        linked.update(dict.fromkeys(set(new) - set(inserted), True))
+    return _results(recipe_ids, linked, ALREADY_ADDED, ADDED)
+
+
+def remove(model, user, recipe_ids):
+    """Убирает рецепты из избранного или корзины одним DELETE … IN.
+
+    Как и add, обходится без сигналов моделей; счётчики и список покупок
+    сдвигаются только для реально удалённых строк.
+    """
+    linked = _resolve(model, user, recipe_ids)
+    stale = [pk for pk, exists in linked.items() if exists]
+    if stale:
+        with transaction.atomic():
+            deleted = _delete(model, user, stale)
+            if deleted:
+                counters.adjust_many(
+                    Recipe,
+                    counters.RELATION_COUNTERS[model],
+                    deleted,
+                    -1,
+                )
+                if model is ShoppingCart:
+                    shopping_list.remove_recipes(user.pk, deleted)
+        # Связь, удалённая параллельно после _resolve, уже отсутствовала.
+        linked.update(dict.fromkeys(set(stale) - set(deleted), False))
+    return _results(recipe_ids, linked, REMOVED, NOT_ADDED)
+
+
+def _insert(model, user, recipe_ids):
+    """Вставляет недостающие связи; возвращает id вставленных рецептов.
+
+    На PostgreSQL — INSERT … ON CONFLICT DO NOTHING RETURNING; в других
+    СУБД существующие связи перечитываются в транзакции вставки.
+    """
+    if connection.vendor != "postgresql":
+        existing = set(
+            model.objects.filter(
+                user=user,
+                recipe_id__in=recipe_ids,
+            ).values_list("recipe_id", flat=True),
+        )
+        inserted = [pk for pk in recipe_ids if pk not in existing]
+        model.objects.bulk_create(
+            [model(user=user, recipe_id=pk) for pk in inserted],
+        )
+        return inserted
+    user_column = column(model, "user")
+    recipe_column = column(model, "recipe")
+    values = ", ".join(["(%s, %s)"] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table(model)} ({user_column}, {recipe_column}) "
+            f"VALUES {values} "
+            f"ON CONFLICT DO NOTHING RETURNING {recipe_column}",
+            [value for pk in recipe_ids for value in (user.pk, pk)],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _delete(model, user, recipe_ids):
+    """Удаляет связи одним DELETE без сигналов pre/post_delete.
+
+    Возвращает id рецептов, чьи связи действительно удалены: на
+    PostgreSQL — через RETURNING, в других СУБД — выборкой перед DELETE
+    в той же транзакции.
+    """
+    returning = connection.vendor == "postgresql"
+    if not returning:
+        recipe_ids = list(
+            model.objects.filter(
+                user=user,
+                recipe_id__in=recipe_ids,
+            ).values_list("recipe_id", flat=True),
+        )
+        if not recipe_ids:
+            return []
+    recipe_column = column(model, "recipe")
+    placeholders = ", ".join(["%s"] * len(recipe_ids))
+    sql = (
+        f"DELETE FROM {table(model)} WHERE {column(model, 'user')} = %s "
+        f"AND {recipe_column} IN ({placeholders})"
+    )
+    with connection.cursor() as cursor:
+        if not returning:
+            cursor.execute(sql, [user.pk, *recipe_ids])
+            return recipe_ids
+        cursor.execute(
+            f"{sql} RETURNING {recipe_column}",
+            [user.pk, *recipe_ids],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def add_one(model, user, recipe_id):
+    """Добавляет один рецепт в избранное или корзину.
+
+    Возвращает (рецепт, создана ли связь); рецепт — None, если его нет.
+    Рецепт загружается с флагами зрителя и author_subscribed, так что
+    ответ строится без повторной выборки. Повторное добавление (двойной
+    клик) даёт created = False, а не IntegrityError.
+    """
+    if connection.vendor != "postgresql":
+        return _add_one_fallback(model, user, recipe_id)
+    with transaction.atomic():
+        recipe = _add_one_returning(model, user, recipe_id)
+        created = recipe is not None and recipe.relation_created
+        # Вставка в обход ORM не порождает сигналов; счётчик сдвинут в
+        # том же запросе, а список покупок обновляем здесь.
+        if created and model is ShoppingCart:
+            shopping_list.add_recipes(user.pk, [recipe.pk])
+    return recipe, created
+
+
+def _add_one_returning(model, user, recipe_id):
+    """Вставка связи, сдвиг счётчика и выборка рецепта одним запросом.
+
+    INSERT … ON CONFLICT DO NOTHING RETURNING сообщает, появилась ли
+    строка, а UPDATE счётчика в соседнем CTE срабатывает только тогда.
+    """
+    columns = ", ".join(
+        connection.ops.quote_name(field.column)
+        for field in Recipe._meta.concrete_fields
+        if field.name != "search_vector"
+    )
+    recipe_pk = column(Recipe, "id")
+    counter = column(Recipe, counters.RELATION_COUNTERS[model])
+    flags = ", ".join(
+        (
+            "TRUE"
+            if relation is model
+            else f"EXISTS (SELECT 1 FROM {table(relation)} "
+            f"WHERE {column(relation, 'user')} = %(user)s "
+            f"AND {column(relation, 'recipe')} = recipe.{recipe_pk})"
+        )
+        + f" AS {flag}"
+        for relation, flag in RELATION_FLAGS.items()
+    )
+    user_column = column(model, "user")
+    recipe_column = column(model, "recipe")
+    sql = f"""
+        WITH recipe AS (
+            SELECT {columns} FROM {table(Recipe)}
+            WHERE {recipe_pk} = %(recipe)s
+        ), inserted AS (
+            INSERT INTO {table(model)} ({user_column}, {recipe_column})
+            SELECT %(user)s, {recipe_pk} FROM recipe
+            ON CONFLICT DO NOTHING
+            RETURNING {recipe_column}
+        ), counted AS (
+            UPDATE {table(Recipe)} SET {counter} = {counter} + 1
+            WHERE {recipe_pk} IN (SELECT {recipe_column} FROM inserted)
+        )
+        SELECT recipe.*, {flags},
+            EXISTS (SELECT 1 FROM inserted) AS relation_created,
+            EXISTS (
+                SELECT 1 FROM {table(Subscription)}
+                WHERE {column(Subscription, 'user')} = %(user)s
+                AND {column(Subscription, 'following')}
+                    = recipe.{column(Recipe, 'author')}
+            ) AS author_subscribed
+        FROM recipe
+    """
+    params = {"user": user.pk, "recipe": recipe_id}
+    return next(iter(Recipe.objects.raw(sql, params)), None)
+
+
+def _add_one_fallback(model, user, recipe_id):
+    # Для остальных СУБД: выборка и вставка, счётчики — в сигналах.
+    recipe = (
+        Recipe.objects.with_user_flags(user)
+        .annotate(
+            author_subscribed=Exists(
+                Subscription.objects.filter(
+                    user=user,
+                    following=OuterRef("author"),
+                ),
+            ),
+        )
+        .defer("search_vector")
+        .filter(pk=recipe_id)
+        .first()
+    )
+    if recipe is None:
+        return None, False
+    try:
+        with transaction.atomic():
+            model.objects.create(user=user, recipe=recipe)
+    except IntegrityError:
+        return recipe, False
+    setattr(recipe, RELATION_FLAGS[model], True)
+    return recipe, True
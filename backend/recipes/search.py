@@ -0,0 +1,193 @@
+from bisect import bisect_left
+import threading
+import time
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db import connections
+from django.db.models import (
+    Case,
+    Count,
+    Exists,
+    F,
+    IntegerField,
+    Max,
+    OuterRef,
+    Q,
+    Subquery,
+    Value,
+    When,
+)
+
+from recipes.models import Ingredient, IngredientInRecipe, Recipe
+
+# Конфигурация полнотекстового поиска PostgreSQL.
+SEARCH_CONFIG = "russian"
+
+
+class IngredientIndex:
+    """Префиксный поиск ингредиентов в памяти воркера.
+
+    Справочник держится отсортированным по casefold-имени массивом, поэтому
+    все совпадения с префиксом лежат подряд и находятся двумя bisect без
+    обращения к БД. Индекс помечается устаревшим сигналами Ingredient в этом
+    процессе, а правки из других процессов (и массовые загрузки) ловятся
+    сверкой версии таблицы не чаще раза в INGREDIENT_SEARCH_REFRESH секунд.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Пара (ключи, строки) подменяется целиком, чтобы читатели
+        # никогда не видели ключи одной версии и строки другой.
+        self._entries = ([], [])
+        self.version = None
+        self._checked_at = 0.0
+        self._stale = True
+
+    def invalidate(self):
+        self._stale = True
+
+    def get_version(self):
+        """Версия таблицы (число строк, max updated), с которой собран индекс."""
+        self._ensure_fresh()
+        return self.version
+
+    def search(self, prefix, limit=None):
+        """Ингредиенты, чьё имя начинается с ``prefix`` (без учёта регистра).
+
+        Точное совпадение идёт первым, дальше — более короткие имена, при
+        равной длине — по алфавиту. Пустой префикс возвращает весь
+        справочник по алфавиту.
+        """
+        self._ensure_fresh()
+        keys, rows = self._entries
+        key = prefix.strip().casefold()
+        if not key:
+            return rows[:limit]
+        start = bisect_left(keys, key)
+        stop = bisect_left(keys, key + "\U0010ffff", start)
+        ranked = sorted(
+            range(start, stop),
+            key=lambda index: (len(keys[index]), keys[index]),
+        )
+        return [rows[index] for index in ranked[:limit]]
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if (
+            not self._stale
+            and now - self._checked_at < settings.INGREDIENT_SEARCH_REFRESH
+        ):
+            return
+        with self._lock:
+            if self._stale or self.version != self._table_version():
+                self._rebuild()
+            self._checked_at = now
+
+    @staticmethod
+    def _table_version():
+        stats = Ingredient.objects.aggregate(
+            count=Count("pk"),
+            last=Max("updated"),
+        )
+        return stats["count"], stats["last"]
+
+    def _rebuild(self):
+        self._stale = False
+        version = self._table_version()
+        entries = sorted(
+            (name.casefold(), pk, unit, name)
+            for pk, name, unit in Ingredient.objects.values_list(
+                "id",
+                "name",
+                "measurement_unit",
+            )
+        )
+        self._entries = (
+            [key for key, *_ in entries],
+            [
+                {"id": pk, "name": name, "measurement_unit": unit}
+                for _, pk, unit, name in entries
+            ],
+        )
+        self.version = version
+
+
+ingredient_index = IngredientIndex()
+
+
+def search_vector():
+    """Выражение для Recipe.search_vector в UPDATE рецептов.
+
+    Вес A — название, B — названия ингредиентов, C — описание. На других
+    СУБД — None: там поиск идёт по подстроке и вектор не хранится.
+    """
+    if connections[Recipe.objects.db].vendor != "postgresql":
+        return None
+    ingredient_names = (
+        IngredientInRecipe.objects.filter(recipe=OuterRef("pk"))
+        .order_by()
+        .values("recipe")
+        .annotate(names=StringAgg("ingredient__name", " "))
+        .values("names")
+    )
+    return (
+        SearchVector("name", weight="A", config=SEARCH_CONFIG)
+        + SearchVector(
+            Subquery(ingredient_names),
+            weight="B",
+            config=SEARCH_CONFIG,
+        )
+        + SearchVector("text", weight="C", config=SEARCH_CONFIG)
+    )
+
+
+def refresh_search_vectors(recipe_ids):
+    """Пересчитывает Recipe.search_vector для указанных рецептов."""
+    vector = search_vector()
+    if recipe_ids and vector is not None:
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            search_vector=vector
+        )
+
+
+def search_recipes(queryset, text):
+    """Отбирает рецепты по запросу и сортирует по релевантности.
+
+    В PostgreSQL используется индексированный search_vector и SearchRank,
+    на остальных СУБД (SQLite в тестах) — поиск подстроки в названии,
+    описании и ингредиентах с приоритетом совпадений в названии.
+    """
+    if connections[queryset.db].vendor == "postgresql":
+        query = SearchQuery(
+            text,
+            config=SEARCH_CONFIG,
+            search_type="websearch",
+        )
+        queryset = queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F("search_vector"), query),
+        )
+    else:
+        in_ingredients = Exists(
+            IngredientInRecipe.objects.filter(
+                recipe=OuterRef("pk"),
+                ingredient__name__icontains=text,
+            ),
+        )
+        queryset = queryset.filter(
+            Q(name__icontains=text)
+            | Q(text__icontains=text)
+            | in_ingredients,
+        ).annotate(
+            search_rank=Case(
+                When(name__icontains=text, then=Value(3)),
+                When(in_ingredients, then=Value(2)),
+                default=Value(1),
+                output_field=IntegerField(),
+            ),
+        )
+    return queryset.order_by("-search_rank", "-created", "-id")
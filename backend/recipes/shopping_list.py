@@ -0,0 +1,134 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from recipes.models import (
+    IngredientInRecipe,
+    ShoppingCart,
+    ShoppingListItem,
+)
+
+User = get_user_model()
+
+
+def add_recipes(user_id, recipe_ids):
+    """Прибавляет ингредиенты рецептов, положенных в корзину."""
+    _apply(user_id, recipe_ids, 1)
+
+
+def remove_recipes(user_id, recipe_ids):
+    """Вычитает ингредиенты рецептов, убранных из корзины.
+
+    Вызывается до удаления строк корзины, пока связи рецепта целы.
+    """
+    _apply(user_id, recipe_ids, -1)
+
+
+def change_recipe(recipe_id, deltas):
+    """Сдвигает списки всех, у кого рецепт в корзине, на правку состава.
+
+    ``deltas`` — {id ингредиента: новое количество минус прежнее}.
+    Вызывается в транзакции, изменившей связи рецепта.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    user_ids = list(
+        ShoppingCart.objects.filter(recipe_id=recipe_id).values_list(
+            "user_id",
+            flat=True,
+        ),
+    )
+    if user_ids:
+        _shift(user_ids, deltas)
+
+
+def _apply(user_id, recipe_ids, sign):
+    amounts = (
+        IngredientInRecipe.objects.filter(recipe_id__in=recipe_ids)
+        .order_by()
+        .values("ingredient_id")
+        .annotate(total=Sum("amount"))
+        .values_list("ingredient_id", "total")
+    )
+    _shift([user_id], {pk: sign * total for pk, total in amounts})
+
+
+def _shift(user_ids, deltas):
+    """Прибавляет ``deltas`` к строкам списков пользователей.
+
+    Недостающие строки создаются, обнулившиеся — удаляются; сам сдвиг —
+    один UPDATE с CASE по ингредиенту.
+    """
+    if not deltas:
+        return
+    items = ShoppingListItem.objects.filter(
+        user_id__in=user_ids,
+        ingredient_id__in=deltas,
+    )
+    delta = Case(
+        *(
+            When(ingredient_id=ingredient_id, then=Value(value))
+            for ingredient_id, value in deltas.items()
+        ),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    with transaction.atomic():
+        _lock(user_ids)
+        ShoppingListItem.objects.bulk_create(
+            [
+                ShoppingListItem(user_id=user_id, ingredient_id=pk)
+                for user_id in user_ids
+                for pk, value in deltas.items()
+                if value > 0
+            ],
+            ignore_conflicts=True,
+        )
+        items.update(total=Greatest(F("total") + delta, Value(0)))
+        if any(value < 0 for value in deltas.values()):
+            items.filter(total=0).delete()
+
+
+def rebuild(user_ids):
+    """Пересчитывает списки покупок пользователей с нуля.
+
+    Нужен после массовых операций в обход сигналов и для восстановления
+    после сбоев (команда rebuild_shopping_lists). Идёт в одной транзакции
+    под той же блокировкой, что и сдвиги, так что параллельная правка
+    корзины не застанет список пересчитанным наполовину.
+    """
+    totals = (
+        IngredientInRecipe.objects.filter(
+            recipe__shoppingcart__user_id__in=user_ids,
+        )
+        .order_by()
+        .values_list("recipe__shoppingcart__user_id", "ingredient_id")
+        .annotate(total=Sum("amount"))
+    )
+    with transaction.atomic():
+        _lock(user_ids)
+        ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+        ShoppingListItem.objects.bulk_create(
+            [
+                ShoppingListItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total=total,
+                )
+                for user_id, ingredient_id, total in totals
+            ],
+        )
+
+
+def _lock(user_ids):
+    # Сдвиги и пересчёт списка одного пользователя идут по очереди:
+    # строки пользователей блокируются до конца транзакции. Порядок по id
+    # исключает взаимоблокировки при сдвиге списков многих пользователей.
+    list(
+        User.objects.select_for_update()
+        .filter(pk__in=user_ids)
+        .order_by("pk")
+        .values_list("pk", flat=True),
+    )
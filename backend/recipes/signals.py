@@ -0,0 +1,384 @@
+from collections import Counter
+import threading
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from recipes import counters, images, shopping_list
+from recipes.cache import invalidate_representations
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    ShoppingCart,
+    Tag,
+)
+from recipes.search import ingredient_index, search_vector
+
+User = get_user_model()
+
+# Поля автора в представлении рецепта (api.serializers.UserSerializer).
+AUTHOR_FIELDS = {"username", "first_name", "last_name", "email", "avatar"}
+# Поля рецепта в поисковом векторе (recipes.search.search_vector).
+SEARCH_FIELDS = {"name", "text"}
+
+# Содержимое рецептов изменилось. Аргументы — списки id: recipe_ids —
+# все изменившиеся, touch_ids — кому сдвинуть updated, reindex_ids — кому
+# пересчитать поисковый вектор. Отправляется через notify_recipes_changed:
+# обработчиками ниже, а также явно после массовых операций, которые не
+# порождают сигналов моделей (bulk_create, update).
+recipes_changed = Signal()
+
+_local = threading.local()
+
+
+class _PendingChanges:
+    def __init__(self):
+        self.recipe_ids = set()
+        self.touch_ids = set()
+        self.reindex_ids = set()
+        # Рецепты, сохранённые в этой транзакции: updated им уже выставил
+        # auto_now (см. recipe_saved).
+        self.saved_recipe_ids = set()
+        # Рецепты, чьи связи с ингредиентами удаляются в этой транзакции
+        # без сдвига списков покупок по каждой связи (см. link_deleted).
+        self.bulk_link_recipe_ids = set()
+
+    def __call__(self):
+        if getattr(_local, "pending", None) is self:
+            _local.pending = None
+        if self.recipe_ids:
+            _send(
+                self.recipe_ids,
+                self.touch_ids - self.saved_recipe_ids,
+                self.reindex_ids,
+            )
+
+
+def _send(recipe_ids, touch_ids, reindex_ids):
+    recipes_changed.send(
+        sender=Recipe,
+        recipe_ids=sorted(recipe_ids),
+        touch_ids=sorted(touch_ids),
+        reindex_ids=sorted(reindex_ids),
+    )
+
+
+def _pending():
+    """Накопитель изменений текущей транзакции; вне транзакции — None."""
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return None
+    pending = getattr(_local, "pending", None)
+    # Откат транзакции (или точки сохранения) снимает отложенный вызов —
+    # тогда начинаем копить заново.
+    if pending is None or not any(
+        func is pending for _, func in connection.run_on_commit
+    ):
+        pending = _local.pending = _PendingChanges()
+        transaction.on_commit(pending)
+    return pending
+
+
+def notify_recipes_changed(recipe_ids, touch=True, reindex=False):
+    """Отправляет recipes_changed после коммита текущей транзакции.
+
+    ``touch`` — сдвинуть Recipe.updated (изменились связанные данные),
+    ``reindex`` — пересчитать поисковый вектор (название, описание или
+    набор ингредиентов). Внутри транзакции id копятся и сигнал уходит
+    один раз: каскадное удаление рецепта или сохранение рецепта вместе со
+    связями не вызывает пересчётов на каждую строку. Вне транзакции сигнал
+    уходит сразу.
+    """
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return
+    touch_ids = recipe_ids if touch else set()
+    reindex_ids = recipe_ids if reindex else set()
+    pending = _pending()
+    if pending is None:
+        _send(recipe_ids, touch_ids, reindex_ids)
+        return
+    pending.recipe_ids.update(recipe_ids)
+    pending.touch_ids.update(touch_ids)
+    pending.reindex_ids.update(reindex_ids)
+
+
+def defer_link_deltas(recipe_id):
+    """Списки покупок сдвинет вызывающий, а не post_delete связей рецепта.
+
+    Действует до конца текущей транзакции.
+    """
+    _pending().bulk_link_recipe_ids.add(recipe_id)
+
+
+def notify_ingredients_changed(recipe_id, deltas, reindex):
+    """Состав рецепта изменился в обход сигналов IngredientInRecipe.
+
+    ``deltas`` — {id ингредиента: новое количество минус прежнее}: на
+    них сразу, в той же транзакции, сдвигаются списки покупок тех, у кого
+    рецепт в корзине. ``reindex`` — изменился ли набор ингредиентов, а не
+    только количества. Кэш и прочее — через notify_recipes_changed.
+    """
+    shopping_list.change_recipe(recipe_id, deltas)
+    notify_recipes_changed([recipe_id], reindex=reindex)
+
+
+@receiver(recipes_changed)
+def drop_cached_representations(sender, recipe_ids, **kwargs):
+    # До update_recipes: записи ещё лежат под прежним updated.
+    invalidate_representations(recipe_ids)
+
+
+@receiver(recipes_changed)
+def update_recipes(sender, touch_ids, reindex_ids, **kwargs):
+    # Recipe.updated служит валидатором условных GET, поэтому сдвигается и
+    # при изменении связанных данных: тегов, ингредиентов, автора. Вместе
+    # с поисковым вектором он пишется одним UPDATE.
+    vector = search_vector() if reindex_ids else None
+    if vector is None:
+        reindex_ids = []
+    recipe_ids = set(touch_ids).union(reindex_ids)
+    values = {}
+    if touch_ids:
+        values["updated"] = _for_ids(
+            touch_ids,
+            recipe_ids,
+            Value(timezone.now(), output_field=DateTimeField()),
+            "updated",
+        )
+    if reindex_ids:
+        values["search_vector"] = _for_ids(
+            reindex_ids,
+            recipe_ids,
+            vector,
+            "search_vector",
+        )
+    if values:
+        Recipe.objects.filter(pk__in=recipe_ids).update(**values)
+
+
+def _for_ids(ids, recipe_ids, value, field):
+    # Значение только для части обновляемых строк — через CASE.
+    if len(ids) == len(recipe_ids):
+        return value
+    return Case(When(pk__in=ids, then=value), default=F(field))
+
+
+@receiver(post_save, sender=ShoppingCart)
+def recipe_added_to_cart(sender, instance, created, **kwargs):
+    if created:
+        shopping_list.add_recipes(instance.user_id, [instance.recipe_id])
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def recipe_removed_from_cart(sender, instance, **kwargs):
+    # pre_delete: при каскадном удалении рецепта его связи ещё на месте.
+    shopping_list.remove_recipes(instance.user_id, [instance.recipe_id])
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def relation_created(sender, instance, created, **kwargs):
+    if created:
+        counters.adjust(
+            Recipe,
+            counters.RELATION_COUNTERS[sender],
+            instance.recipe_id,
+            1,
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def relation_deleted(sender, instance, **kwargs):
+    counters.adjust(
+        Recipe,
+        counters.RELATION_COUNTERS[sender],
+        instance.recipe_id,
+        -1,
+    )
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_author(sender, instance, **kwargs):
+    # Автора можно сменить в админке — тогда счётчик переезжает.
+    instance._previous_author_id = (
+        None
+        if instance._state.adding
+        else Recipe.objects.filter(pk=instance.pk)
+        .values_list("author_id", flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def count_recipe(sender, instance, created, **kwargs):
+    previous = getattr(instance, "_previous_author_id", None)
+    if created:
+        counters.adjust(User, "recipes_count", instance.author_id, 1)
+    elif previous is not None and previous != instance.author_id:
+        counters.adjust(User, "recipes_count", previous, -1)
+        counters.adjust(User, "recipes_count", instance.author_id, 1)
+
+
+@receiver(post_save, sender=Recipe)
+def process_image(sender, instance, **kwargs):
+    # Уменьшенные копии строятся в фоне, когда файл уже в базе.
+    if images.needs_variants(instance):
+        recipe_id, name = instance.pk, instance.image.name
+        transaction.on_commit(
+            lambda: images.schedule_variants(recipe_id, name),
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def uncount_recipe(sender, instance, **kwargs):
+    counters.adjust(User, "recipes_count", instance.author_id, -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, update_fields, **kwargs):
+    # updated уже выставлен auto_now, второй раз его не сдвигаем — ни
+    # здесь, ни из-за правки связей в той же транзакции.
+    pending = _pending()
+    if pending is not None:
+        pending.saved_recipe_ids.add(instance.pk)
+    notify_recipes_changed(
+        [instance.pk],
+        touch=False,
+        reindex=update_fields is None
+        or not SEARCH_FIELDS.isdisjoint(update_fields),
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    notify_recipes_changed([instance.pk], touch=False)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    # Удаление идёт в транзакции Collector, так что накопитель есть.
+    # Корзины рецепта вычитаются целиком в recipe_removed_from_cart.
+    defer_link_deltas(instance.pk)
+
+
+@receiver(pre_save, sender=IngredientInRecipe)
+def remember_link(sender, instance, **kwargs):
+    # Правка связи по одной (админка): нужна разница с прежней строкой.
+    instance._previous_link = (
+        None
+        if instance._state.adding
+        else IngredientInRecipe.objects.filter(pk=instance.pk)
+        .values_list("ingredient_id", "amount")
+        .first()
+    )
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+def link_saved(sender, instance, **kwargs):
+    deltas = Counter({instance.ingredient_id: instance.amount})
+    previous = getattr(instance, "_previous_link", None)
+    if previous is not None:
+        deltas[previous[0]] -= previous[1]
+    shopping_list.change_recipe(instance.recipe_id, deltas)
+    notify_recipes_changed(
+        [instance.recipe_id],
+        reindex=previous is None or previous[0] != instance.ingredient_id,
+    )
+
+
+@receiver(post_delete, sender=IngredientInRecipe)
+def link_deleted(sender, instance, **kwargs):
+    # Для удаляемого рецепта и правки состава через API разницу
+    # применяют целиком (defer_link_deltas) — второй раз вычитать нельзя.
+    pending = _pending()
+    if pending is None or instance.recipe_id not in (
+        pending.bulk_link_recipe_ids
+    ):
+        shopping_list.change_recipe(
+            instance.recipe_id,
+            {instance.ingredient_id: -instance.amount},
+        )
+    notify_recipes_changed([instance.recipe_id], reindex=True)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        recipe_ids = [instance.pk]
+    elif pk_set:
+        recipe_ids = pk_set
+    else:
+        recipe_ids = instance.recipes.values_list("pk", flat=True)
+    notify_recipes_changed(recipe_ids)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def tag_saved(sender, instance, **kwargs):
+    if kwargs.get("created"):
+        return
+    notify_recipes_changed(instance.recipes.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_saved(sender, instance, **kwargs):
+    if kwargs.get("created"):
+        return
+    # Название ингредиента входит в поисковый вектор рецепта.
+    notify_recipes_changed(
+        instance.recipe_links.values_list("recipe_id", flat=True),
+        reindex=True,
+    )
+
+
+@receiver(pre_save, sender=User)
+def remember_author_fields(sender, instance, update_fields, **kwargs):
+    # Отметка last_login при входе, смена пароля и счётчики представление
+    # рецептов не меняют — прежние значения нужны только полям автора.
+    fields = (
+        AUTHOR_FIELDS
+        if update_fields is None
+        else AUTHOR_FIELDS.intersection(update_fields)
+    )
+    instance._previous_author_fields = (
+        None
+        if instance._state.adding or not fields
+        else User.objects.filter(pk=instance.pk).values(*fields).first()
+    )
+
+
+@receiver(post_save, sender=User)
+def author_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, "_previous_author_fields", None)
+    if created or not previous:
+        return
+    if all(
+        getattr(instance, field) == value
+        for field, value in previous.items()
+    ):
+        return
+    notify_recipes_changed(instance.recipes.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_index_outdated(sender, **kwargs):
+    ingredient_index.invalidate()
@@ -0,0 +1,117 @@
+"""Общие фикстуры тестов API.
+
+Тесты с БД рассчитаны на PostgreSQL, как и прод: параметры подключения
+берутся из тех же переменных окружения DB_*, что и в foodgram.settings.
+"""
+
+import base64
+from io import BytesIO
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from PIL import Image
+import pytest
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from users.models import User
+
+
+def png():
+    buffer = BytesIO()
+    Image.new("RGB", (40, 30), "red").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def test_settings(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.IMAGE_PROCESSING_ASYNC = False
+    settings.REQUEST_TIMING_SAMPLE_RATE = 0
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def image():
+    """Путь к изображению, уже лежащему в хранилище."""
+    return default_storage.save("recipes/image.png", ContentFile(png()))
+
+
+@pytest.fixture
+def image_data():
+    """Изображение для полей Base64ImageField."""
+    return "data:image/png;base64," + base64.b64encode(png()).decode()
+
+
+@pytest.fixture
+def make_user(db):
+    def make_user(username):
+        return User.objects.create_user(
+            username=username,
+            email=f"{username}@example.com",
+            password="password-123",
+            first_name=username,
+            last_name="Тестов",
+        )
+
+    return make_user
+
+
+@pytest.fixture
+def user(make_user):
+    return make_user("author")
+
+
+@pytest.fixture
+def client_for():
+    """APIClient с токеном пользователя, как у фронтенда."""
+
+    def client_for(user):
+        client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        return client
+
+    return client_for
+
+
+@pytest.fixture
+def tag(db):
+    return Tag.objects.create(
+        name="Завтрак", color="#E26C2D", slug="breakfast"
+    )
+
+
+@pytest.fixture
+def ingredients(db):
+    return [
+        Ingredient.objects.create(name=name, measurement_unit="г")
+        for name in ("мука", "сахар", "соль", "яйца")
+    ]
+
+
+@pytest.fixture
+def make_recipe(image, tag):
+    def make_recipe(author, amounts, name="Блины"):
+        """Рецепт с ингредиентами ``amounts`` — {ингредиент: количество}."""
+        recipe = Recipe.objects.create(
+            author=author,
+            name=name,
+            text="Смешать и испечь.",
+            cooking_time=20,
+            image=image,
+        )
+        recipe.tags.set([tag])
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe=recipe,
+                ingredient=ingredient,
+                amount=amount,
+            )
+            for ingredient, amount in amounts.items()
+        )
+        return recipe
+
+    return make_recipe
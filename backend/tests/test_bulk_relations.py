@@ -0,0 +1,76 @@
+"""Массовое добавление и удаление избранного и корзины."""
+
+import pytest
+from recipes.models import Favorite, Recipe, ShoppingListItem
+
+
+@pytest.fixture
+def reader(make_user):
+    return make_user("reader")
+
+
+@pytest.fixture
+def recipes(user, make_recipe, ingredients):
+    flour, sugar, *_ = ingredients
+    return [
+        make_recipe(user, {flour: 200, sugar: 30}, name="Блины"),
+        make_recipe(user, {flour: 100}, name="Хлеб"),
+    ]
+
+
+def statuses(response):
+    assert response.status_code == 200
+    return [
+        (item["id"], item["status"]) for item in response.json()["results"]
+    ]
+
+
+def test_favorite_bulk(reader, client_for, recipes):
+    first, second = (recipe.pk for recipe in recipes)
+    client = client_for(reader)
+    client.post(f"/api/recipes/{first}/favorite/")
+    url = "/api/recipes/favorite/bulk/"
+
+    # Повторный id схлопывается, порядок ответа — порядок запроса.
+    response = client.post(
+        url, {"ids": [999999, second, first, second]}, format="json"
+    )
+    assert statuses(response) == [
+        (999999, "not_found"),
+        (second, "added"),
+        (first, "already_added"),
+    ]
+    assert Favorite.objects.filter(user=reader).count() == 2
+    assert Recipe.objects.get(pk=second).favorites_count == 1
+
+    response = client.delete(url, {"ids": [first]}, format="json")
+    assert statuses(response) == [(first, "removed")]
+    response = client.delete(url, {"ids": [first]}, format="json")
+    assert statuses(response) == [(first, "not_added")]
+    assert Recipe.objects.get(pk=first).favorites_count == 0
+
+
+def test_shopping_cart_bulk_shifts_list(reader, client_for, recipes):
+    ids = [recipe.pk for recipe in recipes]
+    client = client_for(reader)
+    url = "/api/recipes/shopping_cart/bulk/"
+    response = client.post(url, {"ids": ids}, format="json")
+    assert statuses(response) == [(pk, "added") for pk in ids]
+    assert dict(
+        ShoppingListItem.objects.filter(user=reader).values_list(
+            "ingredient__name",
+            "total",
+        ),
+    ) == {"мука": 300, "сахар": 30}
+
+    response = client.delete(url, {"ids": ids}, format="json")
+    assert statuses(response) == [(pk, "removed") for pk in ids]
+    assert not ShoppingListItem.objects.filter(user=reader).exists()
+
+
+def test_bulk_validation(reader, client_for):
+    client = client_for(reader)
+    url = "/api/recipes/favorite/bulk/"
+    assert client.post(url, {"ids": []}, format="json").status_code == 400
+    response = client.post(url, {"ids": list(range(1, 102))}, format="json")
+    assert response.status_code == 400
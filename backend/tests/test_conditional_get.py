@@ -0,0 +1,56 @@
+"""Условные GET: ETag, Last-Modified и ответ 304 (api.mixins)."""
+
+from rest_framework.test import APIClient
+from recipes.models import Tag
+
+
+def test_recipe_etag_follows_viewer_flags(
+    user, client_for, make_recipe, ingredients
+):
+    recipe = make_recipe(user, {ingredients[0]: 100})
+    url = f"/api/recipes/{recipe.pk}/"
+    client = client_for(user)
+    response = client.get(url)
+    etag = response["ETag"]
+    assert "Last-Modified" not in response
+    assert "Authorization" in response["Vary"]
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    # Флаги зрителя входят в ETag: после добавления в избранное тело иное.
+    client.post(f"/api/recipes/{recipe.pk}/favorite/")
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.json()["is_favorited"]
+    assert response["ETag"] != etag
+
+
+def test_recipe_edit_changes_etag(
+    user, make_recipe, ingredients, django_capture_on_commit_callbacks
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        recipe = make_recipe(user, {ingredients[0]: 100})
+    url = f"/api/recipes/{recipe.pk}/"
+    client = APIClient()
+    response = client.get(url)
+    etag, last_modified = response["ETag"], response["Last-Modified"]
+    response = client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+    assert response.status_code == 304
+
+    tag = Tag.objects.create(name="Ужин", color="#000000", slug="dinner")
+    with django_capture_on_commit_callbacks(execute=True):
+        recipe.tags.set([tag])
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.json()["tags"][0]["slug"] == "dinner"
+
+
+def test_tag_list_etag_changes_with_table(tag):
+    client = APIClient()
+    etag = client.get("/api/tags/")["ETag"]
+    response = client.get("/api/tags/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    Tag.objects.create(name="Ужин", color="#000000", slug="dinner")
+    response = client.get("/api/tags/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert len(response.json()) == 2
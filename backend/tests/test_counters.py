@@ -0,0 +1,80 @@
+"""Денормализованные счётчики (recipes.counters)."""
+
+import pytest
+from recipes import counters
+from recipes.models import Recipe
+from users.models import User
+
+
+@pytest.fixture
+def reader(make_user):
+    return make_user("reader")
+
+
+def counter(model, pk, field):
+    return model.objects.values_list(field, flat=True).get(pk=pk)
+
+
+def test_relations_shift_recipe_counters(
+    user, reader, client_for, make_recipe, ingredients
+):
+    recipe = make_recipe(user, {ingredients[0]: 100})
+    client = client_for(reader)
+    for action in ("favorite", "shopping_cart"):
+        url = f"/api/recipes/{recipe.pk}/{action}/"
+        assert client.post(url).status_code == 201
+    assert counter(Recipe, recipe.pk, "favorites_count") == 1
+    assert counter(Recipe, recipe.pk, "in_carts_count") == 1
+
+    # Устаревший экземпляр в памяти не затирает счётчики при save().
+    recipe.name = "Оладьи"
+    recipe.save()
+    assert counter(Recipe, recipe.pk, "favorites_count") == 1
+
+    response = client.delete(f"/api/recipes/{recipe.pk}/favorite/")
+    assert response.status_code == 204
+    assert counter(Recipe, recipe.pk, "favorites_count") == 0
+    assert counter(Recipe, recipe.pk, "in_carts_count") == 1
+
+
+def test_recipes_count_follows_author_recipes(
+    user, make_recipe, ingredients
+):
+    recipes = [
+        make_recipe(user, {ingredients[0]: 100}, name=name)
+        for name in ("Блины", "Хлеб")
+    ]
+    assert counter(User, user.pk, "recipes_count") == 2
+    recipes[0].delete()
+    assert counter(User, user.pk, "recipes_count") == 1
+
+
+def test_popular_ordering(
+    user, reader, client_for, make_recipe, ingredients
+):
+    plain, popular = (
+        make_recipe(user, {ingredients[0]: 100}, name=name)
+        for name in ("Хлеб", "Блины")
+    )
+    client_for(reader).post(f"/api/recipes/{popular.pk}/favorite/")
+    response = client_for(reader).get("/api/recipes/?ordering=popular")
+    assert [item["id"] for item in response.json()["results"]] == [
+        popular.pk,
+        plain.pk,
+    ]
+
+
+def test_reconcile_fixes_only_drifted_rows(
+    user, reader, client_for, make_recipe, ingredients
+):
+    recipe = make_recipe(user, {ingredients[0]: 100})
+    client_for(reader).post(f"/api/recipes/{recipe.pk}/favorite/")
+    Recipe.objects.filter(pk=recipe.pk).update(favorites_count=5)
+    User.objects.filter(pk=user.pk).update(recipes_count=0)
+
+    fixed = counters.reconcile()
+    assert fixed[Recipe, "favorites_count"] == 1
+    assert fixed[Recipe, "in_carts_count"] == 0
+    assert fixed[User, "recipes_count"] == 1
+    assert counter(Recipe, recipe.pk, "favorites_count") == 1
+    assert counter(User, user.pk, "recipes_count") == 1
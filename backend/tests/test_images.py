@@ -0,0 +1,36 @@
+"""Декодирование base64 изображений кусками."""
+
+import base64
+import binascii
+
+import pytest
+from recipes import images
+
+RAW = bytes(range(256)) * 3
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # Кусок меньше данных и не кратен 4 после удаления переводов строк.
+    monkeypatch.setattr(images, "DECODE_CHUNK", 10)
+
+
+@pytest.mark.parametrize(
+    "encoded",
+    [
+        base64.b64encode(RAW).decode(),
+        base64.encodebytes(RAW).decode(),
+        base64.encodebytes(RAW).decode().replace("\n", "\r\n"),
+        " ".join(base64.b64encode(RAW).decode()),
+    ],
+)
+def test_decodes_with_whitespace(encoded):
+    upload = images.decode_base64_image(encoded, "image.png")
+    assert upload.read() == RAW
+    assert upload.size == len(RAW)
+
+
+@pytest.mark.parametrize("encoded", ["a", "abcde", "abc"])
+def test_incomplete_group_is_rejected(encoded):
+    with pytest.raises(binascii.Error):
+        images.decode_base64_image(encoded, "image.png")
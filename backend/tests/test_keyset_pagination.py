@@ -0,0 +1,46 @@
+"""Курсорная пагинация ленты рецептов (api.pagination)."""
+
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+from recipes.models import Recipe
+
+
+def walk(client, url):
+    """Ids рецептов со всех страниц, пройденных по ссылкам next."""
+    pages = []
+    while url:
+        data = client.get(url).json()
+        pages.append([item["id"] for item in data["results"]])
+        url = data["next"]
+    return pages
+
+
+def test_pages_follow_created_then_id(user, make_recipe, ingredients):
+    recipes = [
+        make_recipe(user, {ingredients[0]: 100}, name=f"Рецепт {number}")
+        for number in range(5)
+    ]
+    # Три рецепта с одинаковым created: порядок внутри решает id.
+    tied = [recipe.pk for recipe in recipes[:3]]
+    Recipe.objects.filter(pk__in=tied).update(created=timezone.now())
+    expected = list(
+        Recipe.objects.order_by("-created", "-id").values_list(
+            "pk", flat=True
+        )
+    )
+    client = APIClient()
+    pages = walk(client, "/api/recipes/?pagination=cursor&limit=2")
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert sum(pages, []) == expected
+
+    # Новый рецепт не сдвигает уже выданные страницы.
+    first = client.get("/api/recipes/?pagination=cursor&limit=2").json()
+    make_recipe(user, {ingredients[0]: 100}, name="Свежий")
+    assert sum(walk(client, first["next"]), []) == expected[2:]
+
+
+def test_invalid_cursor(db):
+    response = APIClient().get("/api/recipes/?cursor=garbage")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Неверный курсор"}
@@ -0,0 +1,61 @@
+"""Кэш представлений рецептов и сдвиг Recipe.updated."""
+
+import pytest
+from rest_framework.test import APIClient
+from recipes.models import Recipe
+
+
+@pytest.fixture
+def recipe(
+    user, make_recipe, ingredients, django_capture_on_commit_callbacks
+):
+    # Отложенный recipes_changed от создания отправляется сразу, иначе
+    # к нему прицепились бы изменения из самого теста.
+    with django_capture_on_commit_callbacks(execute=True):
+        return make_recipe(user, {ingredients[0]: 100})
+
+
+def updated(recipe):
+    return Recipe.objects.values_list("updated", flat=True).get(
+        pk=recipe.pk
+    )
+
+
+def test_token_login_leaves_recipes_untouched(
+    user, recipe, django_capture_on_commit_callbacks
+):
+    before = updated(recipe)
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        response = APIClient().post(
+            "/api/auth/token/login/",
+            {"email": user.email, "password": "password-123"},
+        )
+    assert response.status_code == 200
+    assert callbacks == []
+    assert updated(recipe) == before
+
+
+def test_author_rename_refreshes_cached_representation(
+    user, recipe, django_capture_on_commit_callbacks
+):
+    url = f"/api/recipes/{recipe.pk}/"
+    client = APIClient()
+    assert client.get(url).json()["author"]["first_name"] == "author"
+    before = updated(recipe)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        user.first_name = "Повар"
+        user.save()
+    assert updated(recipe) > before
+    assert client.get(url).json()["author"]["first_name"] == "Повар"
+
+
+def test_unchanged_author_save_keeps_recipes(
+    user, recipe, django_capture_on_commit_callbacks
+):
+    before = updated(recipe)
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        user.set_password("another-password")
+        user.save()
+    assert callbacks == []
+    assert updated(recipe) == before
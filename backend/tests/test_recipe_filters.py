@@ -0,0 +1,58 @@
+"""План запроса фильтров рецептов: полусоединения без DISTINCT и JOIN.
+
+Запросы только компилируются в SQL, обращения к БД нет.
+"""
+
+from django.http import QueryDict
+
+import pytest
+from api.filters import RecipeFilter
+from recipes.models import Recipe, Tag
+from users.models import User
+
+
+class FakeRequest:
+    def __init__(self, user):
+        self.user = user
+
+
+def filtered_sql(query, user=None):
+    filterset = RecipeFilter(
+        data=QueryDict(query),
+        queryset=Recipe.objects.all(),
+        request=FakeRequest(user),
+    )
+    assert filterset.is_valid(), filterset.errors
+    return str(filterset.qs.query)
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["tags=a&tags=b", "tags=a&tags=b&tags_mode=all"],
+)
+def test_tags_filter_has_no_distinct_or_tag_join(query):
+    sql = filtered_sql(query)
+    tag_table = Tag._meta.db_table
+    assert "EXISTS" in sql
+    assert "DISTINCT" not in sql
+    assert f'JOIN "{tag_table}"' not in sql
+
+
+def test_repeated_and_comma_separated_tags_are_equal():
+    assert filtered_sql("tags=a&tags=b") == filtered_sql("tags=a,b")
+
+
+def test_all_mode_requires_every_tag():
+    # Повторы схлопываются: нужно ровно два разных тега.
+    sql = filtered_sql("tags=a&tags=b&tags=a&tags_mode=all")
+    having = sql.split("HAVING", 1)[1]
+    assert having.split("LIMIT", 1)[0].strip().endswith("= 2")
+
+
+@pytest.mark.parametrize("flag", ["is_favorited", "is_in_shopping_cart"])
+@pytest.mark.parametrize("value", ["1", "0"])
+def test_relation_filters_have_no_distinct_or_join(flag, value):
+    sql = filtered_sql(f"{flag}={value}", user=User(pk=1))
+    assert "EXISTS" in sql
+    assert "DISTINCT" not in sql
+    assert "JOIN" not in sql
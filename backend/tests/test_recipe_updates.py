@@ -0,0 +1,94 @@
+"""Отложенные UPDATE рецептов: Recipe.updated и поисковый вектор."""
+
+from contextlib import contextmanager
+from django.contrib.postgres.search import SearchQuery
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+import pytest
+from recipes.models import Recipe, Tag
+from recipes.search import SEARCH_CONFIG
+
+
+@pytest.fixture
+def recipe(
+    user, make_recipe, ingredients, django_capture_on_commit_callbacks
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        recipe = make_recipe(user, {ingredients[0]: 100})
+    # После коммита записаны варианты изображения и вектор.
+    recipe.refresh_from_db()
+    return recipe
+
+
+@pytest.fixture
+def recipe_updates(django_capture_on_commit_callbacks):
+    """UPDATE таблицы рецептов в блоке вместе с отложенными после коммита."""
+
+    @contextmanager
+    def recipe_updates():
+        updates = []
+        with CaptureQueriesContext(connection) as queries:
+            with django_capture_on_commit_callbacks(execute=True):
+                yield updates
+        table = f'UPDATE "{Recipe._meta.db_table}"'
+        updates.extend(
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith(table)
+        )
+
+    return recipe_updates
+
+
+def found(text):
+    return Recipe.objects.filter(
+        search_vector=SearchQuery(text, config=SEARCH_CONFIG),
+    ).exists()
+
+
+def test_save_reindexes_without_second_touch(recipe, recipe_updates):
+    with recipe_updates() as updates:
+        recipe.name = "Оладьи"
+        recipe.save()
+    # Сам save и один отложенный UPDATE — только вектор.
+    assert len(updates) == 2
+    assert '"search_vector"' in updates[1]
+    assert '"updated"' not in updates[1]
+    assert found("оладьи")
+
+
+def test_tag_change_touches_without_reindex(recipe, recipe_updates):
+    before = recipe.updated
+    tag = Tag.objects.create(name="Ужин", color="#000000", slug="dinner")
+    with recipe_updates() as updates:
+        recipe.tags.set([tag])
+    assert len(updates) == 1
+    assert '"updated"' in updates[0]
+    assert '"search_vector"' not in updates[0]
+    assert Recipe.objects.get(pk=recipe.pk).updated > before
+
+
+def test_api_edit_updates_recipe_row_once_after_commit(
+    user, client_for, recipe, ingredients, image_data, recipe_updates
+):
+    payload = {
+        "name": "Оладьи",
+        "text": "Смешать и пожарить.",
+        "cooking_time": 15,
+        "image": image_data,
+        "tags": list(recipe.tags.values_list("pk", flat=True)),
+        "ingredients": [{"id": ingredients[1].pk, "amount": 50}],
+    }
+    with recipe_updates() as updates:
+        response = client_for(user).patch(
+            f"/api/recipes/{recipe.pk}/",
+            payload,
+            format="json",
+        )
+    assert response.status_code == 200
+    # Варианты нового изображения пишутся отдельно (recipes.images).
+    updates = [sql for sql in updates if 'SET "image_variants"' not in sql]
+    assert len(updates) == 2
+    assert found("сахар")
+    assert not found("мука")
@@ -0,0 +1,60 @@
+"""Создание и правка рецептов через API."""
+
+import pytest
+from recipes.models import ShoppingListItem
+
+
+@pytest.fixture
+def payload(tag, ingredients, image_data):
+    return {
+        "name": "Блины",
+        "text": "Смешать и испечь.",
+        "cooking_time": 20,
+        "image": image_data,
+        "tags": [tag.pk],
+        "ingredients": [
+            {"id": ingredients[0].pk, "amount": 200},
+            {"id": ingredients[1].pk, "amount": 30},
+        ],
+    }
+
+
+def test_duplicate_and_missing_ids_are_reported_together(
+    user, client_for, tag, payload
+):
+    payload["tags"] = [tag.pk, tag.pk, 999999]
+    response = client_for(user).post(
+        "/api/recipes/", payload, format="json"
+    )
+    assert response.status_code == 400
+    assert response.json()["tags"] == [
+        f"Повторяющиеся id: {tag.pk}",
+        "Не найдены объекты с id: 999999",
+    ]
+
+
+def test_edit_shifts_shopping_lists_of_cart_owners(
+    user, make_user, client_for, make_recipe, ingredients, payload
+):
+    flour, sugar, salt, _ = ingredients
+    recipe = make_recipe(user, {flour: 200, sugar: 30, salt: 5})
+    other = make_recipe(user, {salt: 5}, name="Хлеб")
+    buyer = make_user("buyer")
+    for in_cart in (recipe, other):
+        client_for(buyer).post(f"/api/recipes/{in_cart.pk}/shopping_cart/")
+
+    # Соль убрана, мука изменена, сахар прежний.
+    payload["ingredients"] = [
+        {"id": flour.pk, "amount": 250},
+        {"id": sugar.pk, "amount": 30},
+    ]
+    response = client_for(user).patch(
+        f"/api/recipes/{recipe.pk}/", payload, format="json"
+    )
+    assert response.status_code == 200
+    assert dict(
+        ShoppingListItem.objects.filter(user=buyer).values_list(
+            "ingredient__name",
+            "total",
+        ),
+    ) == {"мука": 250, "сахар": 30, "соль": 5}
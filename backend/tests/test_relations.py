@@ -0,0 +1,100 @@
+"""Запросы INSERT … ON CONFLICT для связей и подписок в обход ORM."""
+
+import pytest
+from recipes import relations
+from recipes.models import Favorite, Recipe, ShoppingCart, ShoppingListItem
+from users.models import Subscription
+from users.subscriptions import subscribe
+
+
+@pytest.fixture
+def reader(make_user):
+    return make_user("reader")
+
+
+@pytest.fixture
+def recipe(user, make_recipe, ingredients):
+    return make_recipe(user, {ingredients[0]: 100})
+
+
+def counter(recipe, name):
+    return Recipe.objects.values_list(name, flat=True).get(pk=recipe.pk)
+
+
+def test_add_one_creates_link_once(reader, recipe):
+    Subscription.objects.create(user=reader, following=recipe.author)
+    loaded, created = relations.add_one(ShoppingCart, reader, recipe.pk)
+    assert created
+    assert loaded.pk == recipe.pk
+    assert loaded.is_in_shopping_cart and not loaded.is_favorited
+    assert loaded.author_subscribed
+    assert counter(recipe, "in_carts_count") == 1
+    assert ShoppingListItem.objects.filter(user=reader).count() == 1
+
+    # Повтор упирается в ON CONFLICT, счётчик не сдвигается.
+    loaded, created = relations.add_one(ShoppingCart, reader, recipe.pk)
+    assert loaded.pk == recipe.pk and not created
+    assert counter(recipe, "in_carts_count") == 1
+
+
+def test_add_one_missing_recipe(reader):
+    assert relations.add_one(Favorite, reader, 999999) == (None, False)
+    assert not Favorite.objects.exists()
+
+
+def test_add_counts_only_inserted_rows(reader, recipe, monkeypatch):
+    Favorite.objects.create(user=reader, recipe=recipe)
+    before = counter(recipe, "favorites_count")
+    # Связь вставлена параллельно уже после проверки существующих.
+    monkeypatch.setattr(
+        relations,
+        "_resolve",
+        lambda model, user, recipe_ids: {recipe.pk: False},
+    )
+    assert relations.add(Favorite, reader, [recipe.pk]) == {
+        recipe.pk: relations.ALREADY_ADDED,
+    }
+    assert counter(recipe, "favorites_count") == before
+
+
+def test_remove_counts_only_deleted_rows(reader, recipe, monkeypatch):
+    before = counter(recipe, "favorites_count")
+    # Связь удалена параллельно уже после проверки существующих.
+    monkeypatch.setattr(
+        relations,
+        "_resolve",
+        lambda model, user, recipe_ids: {recipe.pk: True},
+    )
+    assert relations.remove(Favorite, reader, [recipe.pk]) == {
+        recipe.pk: relations.NOT_ADDED,
+    }
+    assert counter(recipe, "favorites_count") == before
+
+
+def test_subscribe_once(user, reader):
+    following, subscription = subscribe(reader, user.pk)
+    assert following == user
+    assert Subscription.objects.get(pk=subscription.pk).user == reader
+
+    following, subscription = subscribe(reader, user.pk)
+    assert following == user and subscription is None
+    assert Subscription.objects.count() == 1
+
+
+def test_subscribe_missing_author(reader):
+    assert subscribe(reader, 999999) == (None, None)
+
+
+def test_subscribe_api_errors(user, reader, client_for):
+    client = client_for(reader)
+    response = client.post(f"/api/users/{reader.pk}/subscribe/")
+    assert response.status_code == 400
+    assert response.json() == {
+        "non_field_errors": ["Нельзя подписаться на себя"],
+    }
+
+    url = f"/api/users/{user.pk}/subscribe/"
+    assert client.post(url).status_code == 201
+    response = client.post(url)
+    assert response.status_code == 400
+    assert response.json() == {"non_field_errors": ["Уже подписаны"]}
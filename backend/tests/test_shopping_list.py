@@ -0,0 +1,73 @@
+"""Материализованный список покупок (recipes.shopping_list)."""
+
+from io import StringIO
+from django.core.management import call_command
+
+import pytest
+from recipes.models import IngredientInRecipe, ShoppingListItem
+
+
+def shopping_list_of(user):
+    return dict(
+        ShoppingListItem.objects.filter(user=user).values_list(
+            "ingredient__name",
+            "total",
+        ),
+    )
+
+
+@pytest.fixture
+def buyer(make_user):
+    return make_user("buyer")
+
+
+@pytest.fixture
+def recipes(user, ingredients, make_recipe):
+    flour, sugar, salt, _ = ingredients
+    return [
+        make_recipe(user, {flour: 200, sugar: 30}, name="Блины"),
+        make_recipe(user, {flour: 100, salt: 5}, name="Хлеб"),
+    ]
+
+
+def test_cart_changes_shift_the_list(buyer, client_for, recipes):
+    client = client_for(buyer)
+    for recipe in recipes:
+        url = f"/api/recipes/{recipe.pk}/shopping_cart/"
+        assert client.post(url).status_code == 201
+    assert shopping_list_of(buyer) == {"мука": 300, "сахар": 30, "соль": 5}
+
+    url = f"/api/recipes/{recipes[0].pk}/shopping_cart/"
+    assert client.delete(url).status_code == 204
+    # Обнулившиеся строки удаляются.
+    assert shopping_list_of(buyer) == {"мука": 100, "соль": 5}
+
+
+def test_link_edit_shifts_lists_of_cart_owners(
+    buyer, client_for, recipes, ingredients
+):
+    client_for(buyer).post(f"/api/recipes/{recipes[0].pk}/shopping_cart/")
+    link = IngredientInRecipe.objects.get(
+        recipe=recipes[0],
+        ingredient=ingredients[1],
+    )
+    # Правка одной связи, как в админке.
+    link.amount = 50
+    link.save()
+    assert shopping_list_of(buyer) == {"мука": 200, "сахар": 50}
+    link.delete()
+    assert shopping_list_of(buyer) == {"мука": 200}
+
+
+def test_rebuild_command_repairs_lists(user, buyer, client_for, recipes):
+    client_for(buyer).post(f"/api/recipes/{recipes[1].pk}/shopping_cart/")
+    ShoppingListItem.objects.filter(user=buyer).update(total=1)
+    # Строка пользователя с пустой корзиной.
+    ShoppingListItem.objects.create(
+        user=user,
+        ingredient=recipes[0].ingredients.first(),
+        total=10,
+    )
+    call_command("rebuild_shopping_lists", batch_size=1, stdout=StringIO())
+    assert shopping_list_of(buyer) == {"мука": 100, "соль": 5}
+    assert shopping_list_of(user) == {}
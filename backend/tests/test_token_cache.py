@@ -0,0 +1,59 @@
+"""Кэш токенной аутентификации (users.authentication)."""
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.authtoken.models import Token
+from users import authentication
+from users.authentication import TokenCache
+
+ME = "/api/users/me/"
+
+
+def token_queries(client):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(ME)
+    assert response.status_code == 200
+    table = f'"{Token._meta.db_table}"'
+    return [
+        query["sql"]
+        for query in queries.captured_queries
+        if table in query["sql"]
+    ]
+
+
+def test_warm_request_skips_token_query(user, client_for):
+    client = client_for(user)
+    assert token_queries(client)
+    assert token_queries(client) == []
+
+
+def test_logout_invalidates_token(user, client_for):
+    client = client_for(user)
+    assert client.get(ME).status_code == 200
+    assert client.post("/api/auth/token/logout/").status_code == 204
+    assert client.get(ME).status_code == 401
+
+
+def test_user_changes_reach_cached_record(user, client_for):
+    client = client_for(user)
+    assert client.get(ME).json()["first_name"] == "author"
+
+    user.first_name = "Повар"
+    user.save()
+    assert client.get(ME).json()["first_name"] == "Повар"
+
+    user.is_active = False
+    user.save()
+    assert client.get(ME).status_code == 401
+
+
+def test_shared_cache_serves_other_workers(
+    user, client_for, settings, monkeypatch
+):
+    settings.TOKEN_CACHE_SHARED = True
+    client = client_for(user)
+    client.get(ME)
+    # Другой воркер: в его LRU записи нет, но она есть в общем кэше.
+    monkeypatch.setattr(authentication, "token_cache", TokenCache())
+    assert token_queries(client) == []
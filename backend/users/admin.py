@@ -31,6 +31,7 @@ class UserAdmin(BaseUserAdmin):
         "last_name",
         "is_active",
         "is_staff",
+        "recipes_count",
         "avatar",
     )
     list_display_links = ("username", "email")
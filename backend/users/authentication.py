@@ -0,0 +1,120 @@
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+# Поля пользователя в записи кэша. Хэш пароля туда не попадает: при
+# обращении (смена пароля) он догружается из БД как отложенное поле.
+USER_FIELDS = [
+    field
+    for field in User._meta.concrete_fields
+    if field.attname != "password"
+]
+USER_FIELD_NAMES = [field.attname for field in USER_FIELDS]
+
+
+def shared_key(key):
+    # В общий кэш ключ токена не попадает в открытом виде.
+    return "auth-token:" + hashlib.sha256(key.encode()).hexdigest()
+
+
+class TokenCache:
+    """Записи «токен → пользователь» в LRU процесса и в общем кэше.
+
+    Запись живёт TOKEN_CACHE_TIMEOUT секунд; в процессе их не больше
+    TOKEN_CACHE_SIZE. При TOKEN_CACHE_SHARED записи дублируются в кэш
+    Django, и промах в LRU одного воркера закрывает запись другого.
+    Сигналы (users.signals) сбрасывают запись в этом процессе и в общем
+    кэше, а LRU других воркеров — только по истечении срока, так что
+    после выхода токен может работать там ещё до TOKEN_CACHE_TIMEOUT.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Запись (срок, создан, значения USER_FIELDS) или None."""
+        now = time.time()
+        with self._lock:
+            record = self._entries.get(key)
+            if record is not None:
+                if record[0] > now:
+                    self._entries.move_to_end(key)
+                    return record
+                del self._entries[key]
+        if not settings.TOKEN_CACHE_SHARED:
+            return None
+        record = cache.get(shared_key(key))
+        if record is None or record[0] <= now:
+            return None
+        self._remember(key, record)
+        return record
+
+    def set(self, token, user):
+        record = (
+            time.time() + settings.TOKEN_CACHE_TIMEOUT,
+            token.created,
+            # Значения как в БД: FieldFile аватара — строкой.
+            [
+                field.get_prep_value(field.value_from_object(user))
+                for field in USER_FIELDS
+            ],
+        )
+        self._remember(token.key, record)
+        if settings.TOKEN_CACHE_SHARED:
+            cache.set(
+                shared_key(token.key),
+                record,
+                settings.TOKEN_CACHE_TIMEOUT,
+            )
+
+    def invalidate(self, keys):
+        keys = list(keys)
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        if settings.TOKEN_CACHE_SHARED and keys:
+            cache.delete_many([shared_key(key) for key in keys])
+
+    def _remember(self, key, record):
+        with self._lock:
+            self._entries[key] = record
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса Token ⨝ User на каждый запрос.
+
+    Пользователь и токен собираются из записи token_cache; при промахе
+    проверка идёт обычным путём и её результат кэшируется. Неверные
+    токены и неактивные пользователи не кэшируются.
+    """
+
+    def authenticate_credentials(self, key):
+        record = token_cache.get(key)
+        if record is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(token, user)
+            return user, token
+        _, created, values = record
+        db = User.objects.db
+        user = User.from_db(db, USER_FIELD_NAMES, values)
+        token = Token.from_db(
+            db,
+            ["key", "user_id", "created"],
+            [key, user.pk, created],
+        )
+        token.user = user
+        return user, token
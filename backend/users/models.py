@@ -2,8 +2,10 @@ from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from recipes.models import CountersMixin
 
-class User(AbstractUser):
+
+class User(CountersMixin, AbstractUser):
     email = models.EmailField(
         unique=True,
         max_length=254,
@@ -17,6 +19,14 @@ class User(AbstractUser):
         default="",
         verbose_name="Аватар",
     )
+    # Поддерживается recipes.counters, см. Recipe.favorites_count.
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Число рецептов",
+    )
+
+    counter_fields = ("recipes_count",)
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username", "first_name", "last_name"]
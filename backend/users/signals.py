@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+from users.authentication import token_cache
+from users.models import User
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    # Выход через djoser (token/logout) и удаление пользователя.
+    token_cache.invalidate([instance.key])
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    # Смена пароля, деактивация и правка профиля меняют пользователя в
+    # кэше; отметка last_login при входе — нет.
+    if created or update_fields == {"last_login"}:
+        return
+    token_cache.invalidate(
+        Token.objects.filter(user=instance).values_list("key", flat=True),
+    )
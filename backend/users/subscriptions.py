@@ -0,0 +1,64 @@
+from django.db import IntegrityError, connection, transaction
+
+from recipes.relations import column, table
+from users.models import Subscription, User
+
+
+def subscribe(user, following_id):
+    """Подписывает ``user`` на автора ``following_id``.
+
+    Возвращает (автор, подписка); автор — None, если его нет, подписка —
+    None, если она уже была. На PostgreSQL вставка и выборка автора — один
+    запрос INSERT … ON CONFLICT DO NOTHING RETURNING, так что повторный
+    запрос не падает с IntegrityError.
+    """
+    if connection.vendor != "postgresql":
+        return _subscribe_fallback(user, following_id)
+    columns = ", ".join(
+        connection.ops.quote_name(field.column)
+        for field in User._meta.concrete_fields
+    )
+    user_pk = column(User, "id")
+    subscription_pk = column(Subscription, "id")
+    sql = f"""
+        WITH following AS (
+            SELECT {columns} FROM {table(User)}
+            WHERE {user_pk} = %(following)s
+        ), inserted AS (
+            INSERT INTO {table(Subscription)} (
+                {column(Subscription, 'user')},
+                {column(Subscription, 'following')}
+            )
+            SELECT %(user)s, {user_pk} FROM following
+            ON CONFLICT DO NOTHING
+            RETURNING {subscription_pk}
+        )
+        SELECT following.*,
+            (SELECT {subscription_pk} FROM inserted) AS subscription_id
+        FROM following
+    """
+    params = {"user": user.pk, "following": following_id}
+    following = next(iter(User.objects.raw(sql, params)), None)
+    if following is None or following.subscription_id is None:
+        return following, None
+    subscription = Subscription(
+        pk=following.subscription_id,
+        user=user,
+        following=following,
+    )
+    return following, subscription
+
+
+def _subscribe_fallback(user, following_id):
+    following = User.objects.filter(pk=following_id).first()
+    if following is None:
+        return None, None
+    try:
+        with transaction.atomic():
+            subscription = Subscription.objects.create(
+                user=user,
+                following=following,
+            )
+    except IntegrityError:
+        return following, None
+    return following, subscription